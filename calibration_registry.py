@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Calibration Registry
+Builds, persists and LRU-evicts stitcher map sets (remap grids, circular
+masks, blend posts, scale maps) keyed by (width, height, fovd, camera profile).
+
+Built map sets are written to CALIBRATION_CACHE_DIR as one .npy per array and
+memory-mapped back by other workers, so each camera model is built once.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from mls_cache import file_sha256
+from stitch_engine import FisheyeStitcher, MAP_ARRAYS, MAX_FOVD, MLS_MAP_PATH
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent
+CALIBRATION_CACHE_DIR = Path(os.environ.get("CALIBRATION_CACHE_DIR",
+                                            PROJECT_ROOT / "utils" / "cache" / "calibration"))
+CALIBRATION_MEMORY_SLOTS = int(os.environ.get("CALIBRATION_MEMORY_SLOTS", 4))
+CALIBRATION_DISK_QUOTA_MB = int(os.environ.get("CALIBRATION_DISK_QUOTA_MB", 1024))
+
+# Bump when the map construction changes so stale persisted sets are ignored
+MAP_VERSION = 3
+
+DEFAULT_PROFILE = "gear360-c200"
+
+# Requested fields of view are rounded to this step (degrees), so nearby
+# values share one map set instead of each starting a full build
+FOVD_STEP = 0.5
+
+# Decimation factors served by preview stitches, each with its own map set
+PREVIEW_SCALES = (2, 4)
+
+# Supported camera models. "mls_map_path" is the rigid MLS grid calibrated for
+# the camera (None stitches without MLS deformation).
+CAMERA_PROFILES = {
+    "gear360-c200": {"fovd": MAX_FOVD, "mls_map_path": MLS_MAP_PATH},
+    "generic": {"fovd": MAX_FOVD, "mls_map_path": None},
+}
+
+
+def scaled_size(width, height, scale=1):
+    """Frame size decimated by scale, trimmed so each fisheye half stays even."""
+    width, height = int(width) // scale, int(height) // scale
+    return width - width % 4, height - height % 2
+
+
+def fit_frame(img, scale=1):
+    """Trim a dual-fisheye frame to stitchable dimensions and decimate it by scale."""
+    height, width = img.shape[:2]
+    if width % 4 or height % 2:
+        img = img[:height - height % 2, :width - width % 4]
+        height, width = img.shape[:2]
+    if scale > 1:
+        img = cv2.resize(img, scaled_size(width, height, scale), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _source_stamp(path):
+    """Cheap identity of a source file (size + mtime) for cache keys."""
+    if path is None:
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def mls_fingerprint(profile=DEFAULT_PROFILE):
+    """
+    SHA-256 of a profile's MLS grid file, so results stitched with a replaced
+    grid are not served from caches; None if the profile has no (readable) grid.
+    The digest is recomputed only when the file's size or mtime changes.
+    """
+    mls_path = CAMERA_PROFILES[profile]["mls_map_path"]
+    try:
+        stamp = _source_stamp(mls_path)
+    except OSError:
+        return None
+    if stamp is None:
+        return None
+    with _fingerprints_lock:
+        cached = _fingerprints.get(str(mls_path))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        digest = file_sha256(mls_path)
+    except OSError:
+        return None
+    with _fingerprints_lock:
+        _fingerprints[str(mls_path)] = (stamp, digest)
+    return digest
+
+
+class CalibrationRegistry:
+    """Process-wide cache of FisheyeStitcher map sets"""
+
+    def __init__(self, cache_dir=None, memory_slots=None, disk_quota_mb=None):
+        self.cache_dir = Path(cache_dir or CALIBRATION_CACHE_DIR)
+        self.memory_slots = memory_slots or CALIBRATION_MEMORY_SLOTS
+        self.disk_quota_bytes = (disk_quota_mb or CALIBRATION_DISK_QUOTA_MB) * 1024 * 1024
+        self._stitchers = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "builds": 0, "evictions": 0}
+
+    @staticmethod
+    def resolve_key(width, height, fovd=None, profile=DEFAULT_PROFILE):
+        """Normalize request parameters into a registry key."""
+        if profile not in CAMERA_PROFILES:
+            raise ValueError(f"Unknown camera profile: {profile}")
+        if fovd is None:
+            fovd = CAMERA_PROFILES[profile]["fovd"]
+        rounded = round(float(fovd) / FOVD_STEP) * FOVD_STEP
+        if not 180.0 < rounded <= 220.0:
+            raise ValueError(f"Unsupported fovd: {fovd} (expected 180-220)")
+        return int(width), int(height), rounded, profile
+
+    def _entry_dir(self, key):
+        width, height, fovd, profile = key
+        mls_path = CAMERA_PROFILES[profile]["mls_map_path"]
+        try:
+            stamp = _source_stamp(mls_path)
+        except OSError:
+            stamp = None
+        fingerprint = hashlib.sha1(json.dumps(
+            [MAP_VERSION, width, height, fovd, profile, str(mls_path), stamp]).encode()).hexdigest()[:12]
+        return self.cache_dir / f"{profile}_{width}x{height}_fov{fovd:g}_{fingerprint}"
+
+    def get(self, width, height, fovd=None, profile=DEFAULT_PROFILE):
+        """Return a stitcher for the key, from memory, disk, or a fresh build."""
+        key = self.resolve_key(width, height, fovd, profile)
+
+        with self._lock:
+            stitcher = self._stitchers.get(key)
+            if stitcher is not None:
+                self._stitchers.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return stitcher
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Build outside the registry lock so other keys are not blocked
+        with build_lock:
+            with self._lock:
+                stitcher = self._stitchers.get(key)
+            if stitcher is None:
+                stitcher = self._load_or_build(key)
+            with self._lock:
+                self._stitchers[key] = stitcher
+                self._stitchers.move_to_end(key)
+                while len(self._stitchers) > self.memory_slots:
+                    evicted, _ = self._stitchers.popitem(last=False)
+                    self.stats["evictions"] += 1
+                    logger.info(f"Evicted calibration {evicted} from memory")
+                # Build locks are only needed while a key is being built
+                if self._build_locks.get(key) is build_lock:
+                    del self._build_locks[key]
+        return stitcher
+
+    def _load_or_build(self, key):
+        width, height, fovd, profile = key
+        entry_dir = self._entry_dir(key)
+
+        maps = self._load_entry(entry_dir)
+        if maps is not None:
+            with self._lock:
+                self.stats["disk_hits"] += 1
+            logger.info(f"Loaded calibration {key} from {entry_dir}")
+            return FisheyeStitcher.from_maps(width, height, fovd, maps)
+
+        stitcher = FisheyeStitcher(width, height, fovd,
+                                   map_path=CAMERA_PROFILES[profile]["mls_map_path"])
+        with self._lock:
+            self.stats["builds"] += 1
+        try:
+            self._save_entry(entry_dir, stitcher.export_maps())
+            self._evict_disk(keep=entry_dir)
+        except OSError as e:
+            logger.warning(f"Could not persist calibration {key}: {e}")
+        return stitcher
+
+    @staticmethod
+    def _load_entry(entry_dir):
+        """Memory-map a persisted map set, or return None if it is incomplete."""
+        if not (entry_dir / "complete").exists():
+            return None
+        try:
+            maps = {path.stem: np.load(path, mmap_mode="r") for path in entry_dir.glob("*.npy")}
+            os.utime(entry_dir)  # LRU bookkeeping
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable calibration {entry_dir}: {e}")
+            return None
+        if any(name not in maps for name in MAP_ARRAYS):
+            return None
+        return maps
+
+    def _save_entry(self, entry_dir, maps):
+        """Write a map set to a temp dir and rename it into place."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.cache_dir / f".{entry_dir.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_dir.mkdir()
+        try:
+            for name, array in maps.items():
+                np.save(tmp_dir / f"{name}.npy", np.asarray(array))
+            (tmp_dir / "complete").touch()
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # Another worker persisted the same set first
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _evict_disk(self, keep=None):
+        """Remove least recently used map sets until the cache fits its quota."""
+        entries = []
+        total = 0
+        for entry_dir in self.cache_dir.iterdir():
+            if not entry_dir.is_dir() or entry_dir.name.startswith("."):
+                continue
+            size = sum(f.stat().st_size for f in entry_dir.iterdir())
+            entries.append((entry_dir.stat().st_mtime, size, entry_dir))
+            total += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.disk_quota_bytes:
+                break
+            if entry_dir == keep:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted calibration {entry_dir.name} from disk")
+
+    def preload(self, width, height, fovd=None, profile=DEFAULT_PROFILE,
+                scales=(1,) + PREVIEW_SCALES):
+        """Build (or load) the full-resolution and decimated map sets for a camera."""
+        for scale in scales:
+            self.get(*scaled_size(width, height, scale), fovd, profile)
+
+    def loaded(self):
+        """Keys of the map sets currently held in memory."""
+        with self._lock:
+            return list(self._stitchers)
+
+
+registry = CalibrationRegistry()
+
+
+def get_stitcher(width, height, fovd=None, profile=DEFAULT_PROFILE, scale=1):
+    """Return this worker's stitcher for a frame size (decimated by scale) and camera."""
+    return registry.get(*scaled_size(width, height, scale), fovd, profile)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    registry.preload(3840, 3840 // 2)
+    print(f"Calibrations ready in {registry.cache_dir}: {registry.loaded()}")
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+HDR Merge
+NumPy merge engine for HDR brackets, replacing ImageMagick's
+-evaluate-sequence / -auto-level.
+
+Mean, min and max stream brackets one at a time into a running accumulator,
+so peak memory is about one bracket plus the accumulator regardless of the
+bracket count. Median needs every bracket, and is computed in horizontal
+strips to bound the temporary stack. Auto-level stretches the result between
+the extremes of its histogram.
+
+The HDR methods (Mertens exposure fusion, Debevec and Robertson radiance maps
+with tonemapping) first align the brackets; shifts are estimated on
+downscaled grayscale copies with median-threshold bitmaps or ECC.
+
+For full-resolution 16-bit merges, OutOfCoreMerge keeps each bracket in a
+memory-mapped scratch file and computes the statistic merges in row strips
+sized to HDR_MERGE_STRIP_MB, so RAM use does not grow with image size or
+bracket count.
+"""
+
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MEDIAN_STRIP_ROWS = 256
+JPEG_QUALITY = 95
+ALIGN_METHODS = ("mtb", "ecc")
+ALIGN_MAX_SIDE = 1024
+ECC_PYRAMID_LEVELS = 3
+MTB_MIN_LEVEL_SIZE = 32
+TONEMAP_GAMMA = 2.2
+HDR_MERGE_STRIP_MB = int(os.environ.get("HDR_MERGE_STRIP_MB", 64))
+# Pixels outside this range (of 1.0) are treated as clipped when estimating exposures
+EXPOSURE_WELL_EXPOSED = (0.05, 0.95)
+
+
+class StreamingMerge:
+    """Base class: thread-safe accumulation of same-sized brackets"""
+
+    stretch = True  # result is auto-leveled before saving
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.count = 0
+        self.shape = None
+        self.dtype = None
+
+    def add(self, img, exposure=None):
+        """Fold one bracket into the merge (exposure time, if known, is used by the HDR methods)."""
+        with self._lock:
+            if self.shape is None:
+                self.shape, self.dtype = img.shape, img.dtype
+                self._start(img)
+            elif img.shape != self.shape:
+                raise ValueError(f"Bracket size {img.shape} does not match earlier brackets {self.shape}")
+            else:
+                self._accumulate(img)
+            self.count += 1
+
+    def result(self):
+        """The merged image."""
+        if self.count == 0:
+            raise ValueError("No brackets to merge")
+        return self._finish()
+
+    def close(self):
+        """Release scratch storage held by the merge."""
+
+
+class MeanMerge(StreamingMerge):
+    def _start(self, img):
+        self._sum = img.astype(np.uint32)
+
+    def _accumulate(self, img):
+        np.add(self._sum, img, out=self._sum)
+
+    def _finish(self):
+        return ((self._sum + self.count // 2) // self.count).astype(self.dtype)
+
+
+class MinMerge(StreamingMerge):
+    def _start(self, img):
+        self._acc = img.copy()
+
+    def _accumulate(self, img):
+        np.minimum(self._acc, img, out=self._acc)
+
+    def _finish(self):
+        return self._acc
+
+
+class MaxMerge(MinMerge):
+    def _accumulate(self, img):
+        np.maximum(self._acc, img, out=self._acc)
+
+
+class CollectingMerge(StreamingMerge):
+    """Base class for merges that need every bracket at once"""
+
+    def _start(self, img):
+        self._brackets = [img]
+
+    def _accumulate(self, img):
+        self._brackets.append(img)
+
+
+class MedianMerge(CollectingMerge):
+    def _finish(self):
+        out = np.empty(self.shape, dtype=self.dtype)
+        for y in range(0, self.shape[0], MEDIAN_STRIP_ROWS):
+            strip = np.stack([b[y:y + MEDIAN_STRIP_ROWS] for b in self._brackets])
+            out[y:y + MEDIAN_STRIP_ROWS] = np.rint(np.median(strip, axis=0))
+        return out
+
+
+class FusionMerge(CollectingMerge):
+    """Base class for the HDR methods: align the brackets, then fuse them to 8 bits"""
+
+    stretch = False
+
+    def __init__(self, align="mtb"):
+        super().__init__()
+        if align not in ALIGN_METHODS + (None,):
+            raise ValueError(f"Unknown alignment: {align} (expected one of {', '.join(ALIGN_METHODS)})")
+        self.align = align
+        self._exposures = []
+        self.shifts = None
+
+    def add(self, img, exposure=None):
+        with self._lock:
+            super().add(img, exposure)
+            self._exposures.append(exposure)
+
+    def _finish(self):
+        brackets = [to_8bit(img) for img in self._brackets]
+        if len(brackets) == 1:
+            return brackets[0]
+        if self.align:
+            brackets, self.shifts = align_brackets(brackets, self.align)
+        return self._fuse(brackets)
+
+
+class MertensMerge(FusionMerge):
+    def _fuse(self, brackets):
+        fused = cv2.createMergeMertens().process(brackets)
+        return _float_to_8bit(fused)
+
+
+class DebevecMerge(FusionMerge):
+    calibrate = staticmethod(cv2.createCalibrateDebevec)
+    merge = staticmethod(cv2.createMergeDebevec)
+
+    def _fuse(self, brackets):
+        times = np.asarray(exposure_times(brackets, self._exposures), dtype=np.float32)
+        # The camera response is global, so calibrate it on downscaled brackets
+        response = self.calibrate().process([_downscale(img, ALIGN_MAX_SIDE) for img in brackets], times)
+        radiance = self.merge().process(brackets, times, response)
+        return _float_to_8bit(cv2.createTonemapReinhard(gamma=TONEMAP_GAMMA).process(radiance))
+
+
+class RobertsonMerge(DebevecMerge):
+    calibrate = staticmethod(cv2.createCalibrateRobertson)
+    merge = staticmethod(cv2.createMergeRobertson)
+
+
+# Per-strip reductions over a (brackets, rows, width, channels) stack
+STRIP_REDUCERS = {
+    "mean": lambda stack: stack.mean(axis=0, dtype=np.float32),
+    "median": lambda stack: np.median(stack, axis=0),
+    "min": lambda stack: stack.min(axis=0),
+    "max": lambda stack: stack.max(axis=0),
+}
+
+
+class OutOfCoreMerge(StreamingMerge):
+    """Statistic merge of memory-mapped brackets, computed in row strips"""
+
+    def __init__(self, method, scratch_dir, strip_mb=None):
+        super().__init__()
+        if method not in STRIP_REDUCERS:
+            raise ValueError(f"Full-resolution merges support {', '.join(STRIP_REDUCERS)}, not {method}")
+        self.method = method
+        self.scratch_dir = Path(scratch_dir)
+        self.strip_bytes = (strip_mb or HDR_MERGE_STRIP_MB) * 1024 * 1024
+        self._paths = []
+
+    def add(self, img, exposure=None):
+        with self._lock:
+            if self.shape is None:
+                self.shape, self.dtype = img.shape, img.dtype
+                self.scratch_dir.mkdir(parents=True, exist_ok=True)
+            elif img.shape != self.shape or img.dtype != self.dtype:
+                raise ValueError(f"Bracket {img.shape} {img.dtype} does not match earlier brackets "
+                                 f"{self.shape} {self.dtype}")
+            path = self.scratch_dir / f"bracket_{len(self._paths)}.raw"
+            self._paths.append(path)
+        # Written outside the lock so brackets spill to disk concurrently
+        scratch = np.memmap(path, dtype=self.dtype, mode="w+", shape=self.shape)
+        scratch[:] = img
+        scratch.flush()
+        del scratch
+        with self._lock:
+            self.count += 1
+
+    def strip_rows(self):
+        """Rows per strip so the float working set of all brackets fits the strip budget."""
+        row_bytes = int(np.prod(self.shape[1:])) * 8 * (len(self._paths) + 1)
+        return max(1, self.strip_bytes // row_bytes)
+
+    def _finish(self):
+        brackets = [np.memmap(path, dtype=self.dtype, mode="r", shape=self.shape) for path in self._paths]
+        out = np.memmap(self.scratch_dir / "merged.raw", dtype=self.dtype, mode="w+", shape=self.shape)
+        reduce = STRIP_REDUCERS[self.method]
+        rows = self.strip_rows()
+        for y in range(0, self.shape[0], rows):
+            stack = np.stack([b[y:y + rows] for b in brackets])
+            out[y:y + rows] = np.rint(reduce(stack))
+        out.flush()
+        return out
+
+    def close(self):
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+def to_8bit(img):
+    if img.dtype == np.uint16:
+        return cv2.convertScaleAbs(img, alpha=1 / 257)
+    return img
+
+
+def _float_to_8bit(img):
+    return np.clip(np.nan_to_num(img) * 255 + 0.5, 0, 255).astype(np.uint8)
+
+
+def _downscale(img, max_side):
+    scale = max_side / max(img.shape[:2])
+    if scale >= 1:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def _small_gray(img, max_side):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = _downscale(gray, max_side)
+    return small, small.shape[1] / gray.shape[1]
+
+
+def _ecc_shift(ref, img):
+    """Translation moving img onto ref, refined coarse to fine over a pyramid."""
+    refs, imgs = [ref.astype(np.float32)], [img.astype(np.float32)]
+    for _ in range(ECC_PYRAMID_LEVELS - 1):
+        refs.append(cv2.pyrDown(refs[-1]))
+        imgs.append(cv2.pyrDown(imgs[-1]))
+    warp = np.eye(2, 3, dtype=np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 50, 1e-4)
+    for level in range(ECC_PYRAMID_LEVELS - 1, -1, -1):
+        try:
+            _, warp = cv2.findTransformECC(refs[level], imgs[level], warp, cv2.MOTION_TRANSLATION,
+                                           criteria, None, 5)
+        except cv2.error:
+            logger.warning(f"ECC alignment did not converge at pyramid level {level}")
+        if level:
+            warp[:, 2] *= 2
+    return -warp[0, 2], -warp[1, 2]
+
+
+def align_brackets(brackets, method="mtb", max_side=ALIGN_MAX_SIDE):
+    """
+    Translate brackets onto the one of median brightness. Shifts are found on
+    grayscale copies downscaled to max_side and scaled back up. Returns the
+    aligned brackets and their (dx, dy) shifts.
+    """
+    grays = [_small_gray(img, max_side) for img in brackets]
+    ref = int(np.argsort([gray.mean() for gray, _ in grays])[len(grays) // 2])
+    ref_gray, scale = grays[ref]
+    # Keep the coarsest MTB level at least MTB_MIN_LEVEL_SIZE pixels across
+    max_bits = int(np.clip(np.log2(min(ref_gray.shape) / MTB_MIN_LEVEL_SIZE), 1, 6))
+    mtb = cv2.createAlignMTB(max_bits) if method == "mtb" else None
+
+    aligned, shifts = [], []
+    for i, img in enumerate(brackets):
+        dx = dy = 0.0
+        if i != ref:
+            if mtb is not None:
+                dx, dy = mtb.calculateShift(ref_gray, grays[i][0])
+            else:
+                dx, dy = _ecc_shift(ref_gray, grays[i][0])
+            dx, dy = dx / scale, dy / scale
+        if round(dx) or round(dy):
+            height, width = img.shape[:2]
+            shift = np.float32([[1, 0, dx], [0, 1, dy]])
+            img = cv2.warpAffine(img, shift, (width, height), flags=cv2.INTER_LINEAR,
+                                 borderMode=cv2.BORDER_REFLECT)
+        aligned.append(img)
+        shifts.append((float(dx), float(dy)))
+    logger.info(f"Aligned {len(brackets)} brackets ({method}): {shifts}")
+    return aligned, shifts
+
+
+def estimate_exposures(brackets):
+    """
+    Relative exposure times from image content: brackets are ordered by
+    brightness and each neighbouring pair is compared over the pixels well
+    exposed in both, after undoing the display gamma.
+    """
+    lo, hi = EXPOSURE_WELL_EXPOSED
+    samples = [_small_gray(to_8bit(img), ALIGN_MAX_SIDE // 2)[0] / 255.0 for img in brackets]
+    order = np.argsort([s.mean() for s in samples])
+    times = np.ones(len(brackets))
+    for prev, cur in zip(order[:-1], order[1:]):
+        a, b = samples[prev], samples[cur]
+        mask = (a > lo) & (a < hi) & (b > lo) & (b < hi)
+        if not mask.any():
+            mask = np.ones_like(a, dtype=bool)
+        ratio = (b[mask] ** TONEMAP_GAMMA).mean() / max((a[mask] ** TONEMAP_GAMMA).mean(), 1e-6)
+        times[cur] = times[prev] * max(ratio, 1.0)
+    return list(times)
+
+
+def exposure_times(brackets, exposures):
+    """EXIF exposure times when every bracket has one, otherwise estimated ones."""
+    if all(exposures) and len(set(exposures)) > 1:
+        return list(exposures)
+    logger.info("Exposure times unavailable; estimating them from bracket brightness")
+    return estimate_exposures(brackets)
+
+
+MERGE_METHODS = {
+    "mean": MeanMerge,
+    "median": MedianMerge,
+    "min": MinMerge,
+    "max": MaxMerge,
+    "mertens": MertensMerge,
+    "debevec": DebevecMerge,
+    "robertson": RobertsonMerge,
+}
+
+
+def create_merge(method, align="mtb", scratch_dir=None):
+    """
+    New accumulator for a merge method name; align only applies to the HDR
+    methods. With scratch_dir, returns an out-of-core merge spilling brackets
+    there (statistic methods only).
+    """
+    if method not in MERGE_METHODS:
+        raise ValueError(f"Unknown merge method: {method} (expected one of {', '.join(MERGE_METHODS)})")
+    if scratch_dir is not None:
+        return OutOfCoreMerge(method, scratch_dir)
+    merge_class = MERGE_METHODS[method]
+    if issubclass(merge_class, FusionMerge):
+        return merge_class(align=align)
+    return merge_class()
+
+
+def _histogram(img, rows):
+    levels = np.iinfo(img.dtype).max + 1
+    hist = np.zeros(levels)
+    for y in range(0, img.shape[0], rows):
+        strip = np.ascontiguousarray(img[y:y + rows]).reshape(-1, 1)
+        hist += cv2.calcHist([strip], [0], None, [levels], [0, levels]).ravel()
+    return hist
+
+
+def _level_lut(hist, dtype):
+    """Lookup table stretching the occupied histogram range to full scale, or None if flat."""
+    levels = len(hist)
+    occupied = np.flatnonzero(hist)
+    lo, hi = occupied[0], occupied[-1]
+    if hi <= lo:
+        return None
+    lut = np.clip((np.arange(levels) - lo) * ((levels - 1) / (hi - lo)), 0, levels - 1)
+    return np.rint(lut).astype(dtype)
+
+
+def _apply_lut(img, lut):
+    if img.dtype == np.uint8:
+        return cv2.LUT(img, lut)
+    return lut[img]
+
+
+def auto_level(img):
+    """Stretch an 8- or 16-bit image so its darkest value maps to 0 and its brightest to full scale."""
+    lut = _level_lut(_histogram(img, img.shape[0]), img.dtype)
+    return img if lut is None else _apply_lut(img, lut)
+
+
+def render_8bit(img, stretch=True, rows=MEDIAN_STRIP_ROWS):
+    """
+    8-bit copy of a merged image, auto-leveled when stretch is set. Works in
+    row strips so a memory-mapped 16-bit result is never loaded whole.
+    """
+    lut = _level_lut(_histogram(img, rows), img.dtype) if stretch else None
+    out = np.empty(img.shape, dtype=np.uint8)
+    for y in range(0, img.shape[0], rows):
+        strip = img[y:y + rows]
+        out[y:y + rows] = to_8bit(strip if lut is None else _apply_lut(strip, lut))
+    return out
+
+
+def write_jpeg(img, path, quality=JPEG_QUALITY):
+    """Write a merged image as JPEG (16-bit input is scaled down to 8 bits)."""
+    img = to_8bit(img)
+    if not cv2.imwrite(str(path), img, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+        raise RuntimeError(f"Error writing merged image {path}")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+HDR Bracket Pipeline
+Streams each HDR bracket through download -> raw decode -> optimize as soon as
+its previous stage finishes, instead of running each phase over all brackets
+in turn. Decoded brackets stay in memory as NumPy arrays. Brackets progress
+in parallel; downloads run on the downloader's pool (HDR_DOWNLOAD_WORKERS) and
+the CPU-bound stages are bounded by HDR_CPU_SLOTS, so end-to-end latency
+approaches that of the slowest single bracket. Full-resolution brackets are
+also bounded by HDR_MEMORY_BUDGET_MB: each one holds a whole 16-bit frame plus
+the decoder's buffers (about HDR_FULLRES_BRACKET_MB) until it is spilled, so
+only as many decode at once as fit in the budget.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from raw_decode import decode_raw, optimize_bracket, read_exposure_time
+
+logger = logging.getLogger(__name__)
+
+HDR_CPU_SLOTS = int(os.environ.get("HDR_CPU_SLOTS", os.cpu_count() or 2))
+HDR_MEMORY_BUDGET_MB = int(os.environ.get("HDR_MEMORY_BUDGET_MB", 512))
+HDR_FULLRES_BRACKET_MB = int(os.environ.get("HDR_FULLRES_BRACKET_MB", 200))
+
+
+class HDRBracketPipeline:
+    """Overlapped per-bracket download, raw decode and optimize"""
+
+    def __init__(self, downloader, cpu_slots=None, memory_budget_mb=None, bracket_mb=None):
+        self.downloader = downloader
+        self.cpu_slots = cpu_slots or HDR_CPU_SLOTS
+        self._cpu = threading.BoundedSemaphore(self.cpu_slots)
+        budget = memory_budget_mb or HDR_MEMORY_BUDGET_MB
+        self.full_res_slots = max(1, min(self.cpu_slots, budget // (bracket_mb or HDR_FULLRES_BRACKET_MB)))
+        self._full_res = threading.BoundedSemaphore(self.full_res_slots)
+
+    def decode(self, dng_path, half_size=False, quality=3):
+        """Raw-decode a downloaded DNG to a 16-bit array; returns None on failure."""
+        try:
+            img = decode_raw(dng_path, half_size=half_size, quality=quality)
+        except RuntimeError as e:
+            logger.error(str(e))
+            return None
+        finally:
+            Path(dng_path).unlink(missing_ok=True)
+        return img
+
+    def optimize(self, img):
+        """8-bit, at most 4096px copy of a decoded bracket for merging."""
+        return optimize_bracket(img)
+
+    def process(self, url, dest_dir, half_size=False, quality=3, full_resolution=False, sink=None):
+        """
+        Run one bracket through all stages; returns (merge-ready array,
+        exposure time or None), or None if the bracket could not be decoded.
+        With full_resolution the optimize step is skipped, keeping 16 bits,
+        and the bracket also takes one of full_res_slots memory slots.
+        With a sink, sink(array, exposure) consumes the bracket before its CPU
+        slot is released (so at most cpu_slots decoded brackets are held at
+        once) and True is returned instead; a ValueError from the sink (such
+        as a size mismatch) is re-raised naming the bracket.
+        """
+        name = Path(url.split('?')[0]).name
+        start = time.perf_counter()
+        dng_path = self.downloader.submit(url, dest_dir).result()
+        exposure = read_exposure_time(dng_path)
+        downloaded = time.perf_counter()
+
+        cache = self.downloader.cache
+        options = {"half_size": half_size, "quality": quality}
+        # Take the memory slot first so waiting brackets do not hold CPU slots
+        with self._full_res if full_resolution else nullcontext(), self._cpu:
+            img = cache.get_decoded(url, options) if cache is not None else None
+            if img is not None:
+                Path(dng_path).unlink(missing_ok=True)
+            else:
+                img = self.decode(dng_path, half_size, quality)
+                if img is None:
+                    return None
+                if cache is not None:
+                    cache.put_decoded(url, options, img)
+            decoded = time.perf_counter()
+
+            if not full_resolution:
+                img = self.optimize(img)
+            optimized = time.perf_counter()
+            if sink is not None:
+                try:
+                    sink(img, exposure)
+                except ValueError as e:
+                    raise ValueError(f"{name}: {e}") from e
+        logger.info(f"Bracket {name}: download {downloaded - start:.1f}s, "
+                    f"decode {decoded - downloaded:.1f}s, optimize {optimized - decoded:.1f}s")
+        return True if sink is not None else (img, exposure)
+
+    def _run_all(self, urls, fn):
+        if not urls:
+            return []
+        workers = min(len(urls), self.downloader.workers + self.cpu_slots)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hdr-bracket") as executor:
+            futures = [executor.submit(fn, url) for url in urls]
+            try:
+                return [future.result() for future in futures]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def run(self, urls, dest_dir, **options):
+        """Process all brackets concurrently; returns the merge-ready arrays in URL order."""
+        brackets = self._run_all(urls, lambda url: self.process(url, dest_dir, **options))
+        return [bracket[0] for bracket in brackets if bracket is not None]
+
+    def merge(self, urls, dest_dir, merger, **options):
+        """
+        Process all brackets concurrently, folding each into `merger` as soon
+        as it is ready so finished brackets are not kept. Returns the number
+        of brackets merged.
+        """
+        return sum(bool(result) for result in self._run_all(
+            urls, lambda url: self.process(url, dest_dir, sink=merger.add, **options)))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Image Probe
+Reads image dimensions, channel count and bit depth from the file header only
+(JPEG SOF, PNG IHDR, BMP info header), so uploads can be validated without
+decoding any pixels.
+"""
+
+import struct
+from collections import namedtuple
+from io import BytesIO
+
+ImageInfo = namedtuple("ImageInfo", ["format", "width", "height", "channels", "bit_depth"])
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG color type -> channels
+PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+# JPEG start-of-frame markers (C4 DHT, C8 JPG and CC DAC share the range)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _probe_jpeg(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            continue
+        marker = f.read(1)
+        while marker == b"\xff":  # fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue  # standalone markers
+        if marker == 0xD9 or marker == 0xDA:
+            return None  # end of image / start of scan before any frame header
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in JPEG_SOF_MARKERS:
+            header = f.read(6)
+            if len(header) < 6:
+                return None
+            bit_depth, height, width, channels = struct.unpack(">BHHB", header)
+            return ImageInfo("jpeg", width, height, channels, bit_depth)
+        f.seek(length - 2, 1)
+
+
+def _probe_png(f):
+    f.seek(8)
+    chunk = f.read(8 + 13)
+    if len(chunk) < 21 or chunk[4:8] != b"IHDR":
+        return None
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", chunk[8:18])
+    if color_type not in PNG_CHANNELS:
+        return None
+    return ImageInfo("png", width, height, PNG_CHANNELS[color_type], bit_depth)
+
+
+def _probe_bmp(f):
+    f.seek(14)
+    header = f.read(16)
+    if len(header) < 4:
+        return None
+    header_size = struct.unpack("<I", header[:4])[0]
+    if header_size == 12:  # OS/2 BITMAPCOREHEADER
+        if len(header) < 12:
+            return None
+        width, height, _, bpp = struct.unpack("<HHHH", header[4:12])
+    elif header_size >= 40:
+        if len(header) < 16:
+            return None
+        width, height, _, bpp = struct.unpack("<iiHH", header[4:16])
+    else:
+        return None
+    channels = 4 if bpp == 32 else 3  # palette and 16-bit images decode to BGR
+    return ImageInfo("bmp", abs(width), abs(height), channels, 8)
+
+
+def probe_image(source):
+    """
+    Header-only probe of a JPEG, PNG or BMP image.
+    source is bytes, a path or a binary file object; returns ImageInfo or None
+    when the format is not recognized or the header is truncated.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _probe_stream(BytesIO(source))
+    if hasattr(source, "read"):
+        position = source.tell()
+        try:
+            return _probe_stream(source)
+        finally:
+            source.seek(position)
+    with open(source, "rb") as f:
+        return _probe_stream(f)
+
+
+def _probe_stream(f):
+    f.seek(0)
+    magic = f.read(8)
+    try:
+        if magic[:2] == b"\xff\xd8":
+            return _probe_jpeg(f)
+        if magic == PNG_SIGNATURE:
+            return _probe_png(f)
+        if magic[:2] == b"BM":
+            return _probe_bmp(f)
+    except (struct.error, OSError, ValueError):
+        return None
+    return None
@@ -54,6 +54,7 @@ private:
     void genScaleMap();
     cv::Mat compenLightFO(const cv::Mat &in_img);
     void createBlendMask();
+    void createBlendAlpha();
     void init();
 
     cv::Point2f findMatchLoc(const cv::Mat &Ref, 
@@ -94,6 +95,8 @@ private:
     cv::Mat m_inner_cir_mask;
     cv::Mat m_binary_mask;
     std::vector<int> m_blend_post;
+    cv::Mat m_blend_alpha; // seam ramp weights of the left image (CV_32FC3)
+    cv::Mat m_blend_band;  // pixels covered by the seam ramps (CV_8U)
     cv::Mat m_scale_map;
     cv::Mat m_mls_map_x;
     cv::Mat m_mls_map_y;
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+MLS Grid Cache
+Converts the gzipped OpenCV YAML MLS grid into a raw .npy file once, so every
+worker can memory-map it instead of decompressing and text-parsing it.
+
+The cache is keyed by a SHA-256 of the source file and is rebuilt whenever the
+source changes. Run this module directly to prebuild the cache.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent
+MLS_CACHE_DIR = Path(os.environ.get("MLS_CACHE_DIR", PROJECT_ROOT / "utils" / "cache"))
+
+
+def read_mls_yaml(map_path):
+    """Read the rigid MLS interpolation grids (Xd, Yd) from an OpenCV YAML file."""
+    fs = cv2.FileStorage(str(map_path), cv2.FILE_STORAGE_READ)
+    if not fs.isOpened():
+        raise RuntimeError(f"Cannot open map file: {map_path}")
+    try:
+        mls_map_x = fs.getNode("Xd").mat()
+        mls_map_y = fs.getNode("Yd").mat()
+    finally:
+        fs.release()
+    if mls_map_x is None or mls_map_y is None:
+        raise RuntimeError(f"Map file is missing Xd/Yd grids: {map_path}")
+    return mls_map_x.astype(np.float32), mls_map_y.astype(np.float32)
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_paths(map_path, cache_dir=None):
+    """Return the (.npy, .json, .lock) cache paths for an MLS map file."""
+    cache_dir = Path(cache_dir or MLS_CACHE_DIR)
+    # Grids with the same name in different directories get separate entries
+    source = hashlib.sha256(str(Path(map_path).resolve()).encode()).hexdigest()[:12]
+    stem = f"{Path(map_path).name.split('.')[0]}-{source}"
+    return (cache_dir / f"{stem}.npy",
+            cache_dir / f"{stem}.json",
+            cache_dir / f"{stem}.lock")
+
+
+def _cache_is_fresh(map_path, npy_path, meta_path):
+    """Check the cached grid against the source, hashing only if its stat changed."""
+    if not npy_path.exists() or not meta_path.exists():
+        return False
+    try:
+        meta = json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        return False
+
+    st = os.stat(map_path)
+    if meta.get("size") == st.st_size and meta.get("mtime_ns") == st.st_mtime_ns:
+        return True
+
+    # Touched but possibly unchanged: compare content before rebuilding
+    if meta.get("sha256") != file_sha256(map_path):
+        return False
+    meta.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+    _write_atomic(meta_path, json.dumps(meta).encode())
+    return True
+
+
+def _write_atomic(path, data):
+    """Write bytes next to path and rename into place."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build_cache(map_path, cache_dir=None):
+    """Parse the YAML grid and write it as a (2, H, W) float32 .npy plus metadata."""
+    npy_path, meta_path, _ = cache_paths(map_path, cache_dir)
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+
+    logger.info(f"Converting MLS grid {map_path} -> {npy_path}")
+    mls_map_x, mls_map_y = read_mls_yaml(map_path)
+    grid = np.ascontiguousarray(np.stack([mls_map_x, mls_map_y]))
+
+    tmp_path = npy_path.with_name(f".{npy_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, grid)
+    os.replace(tmp_path, npy_path)
+
+    st = os.stat(map_path)
+    meta = {
+        "source": str(map_path),
+        "sha256": file_sha256(map_path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "shape": list(grid.shape),
+    }
+    _write_atomic(meta_path, json.dumps(meta).encode())
+    return npy_path
+
+
+def load_mls_maps(map_path, cache_dir=None):
+    """
+    Return (map_x, map_y) for an MLS grid, memory-mapped from the binary cache.
+    The cache is (re)built under a file lock so concurrent workers convert once.
+    Falls back to parsing the YAML directly if the cache dir is not writable.
+    """
+    map_path = Path(map_path)
+    if not map_path.exists():
+        raise RuntimeError(f"Cannot open map file: {map_path}")
+
+    npy_path, meta_path, lock_path = cache_paths(map_path, cache_dir)
+    try:
+        if not _cache_is_fresh(map_path, npy_path, meta_path):
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(lock_path, "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Another worker may have finished the conversion meanwhile
+                if not _cache_is_fresh(map_path, npy_path, meta_path):
+                    build_cache(map_path, cache_dir)
+    except OSError as e:
+        logger.warning(f"MLS cache unavailable ({e}), parsing {map_path} directly")
+        return read_mls_yaml(map_path)
+
+    grid = np.load(npy_path, mmap_mode="r")
+    return grid[0], grid[1]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for path in sys.argv[1:] or [PROJECT_ROOT / "utils" / "grid_xd_yd_3840x1920.yml.gz"]:
+        load_mls_maps(path)
+        print(f"MLS cache ready for {path}: {cache_paths(path)[0]}")
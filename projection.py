@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Panorama Projection
+Extracts perspective views and cubemap faces from equirectangular panoramas.
+
+Remap tables are computed once per (panorama size, output size, yaw, pitch,
+fov), converted to fixed-point maps and kept in an LRU cache, so repeated
+views with the same parameters only cost the remap.
+
+Longitude wraps around and latitude clamps at the poles: panoramas are padded
+with one wrapped column on each side and remapped with BORDER_REPLICATE, so
+samples never wrap vertically onto the opposite pole.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECTION_CACHE_SLOTS = int(os.environ.get("PROJECTION_CACHE_SLOTS", 32))
+
+# Cube face name -> (yaw, pitch) in degrees; yaw 0 looks at the panorama center
+CUBE_FACES = OrderedDict([
+    ("front", (0.0, 0.0)),
+    ("right", (90.0, 0.0)),
+    ("back", (180.0, 0.0)),
+    ("left", (-90.0, 0.0)),
+    ("up", (0.0, 90.0)),
+    ("down", (0.0, -90.0)),
+])
+
+
+def perspective_maps(pano_size, out_size, yaw, pitch, fov):
+    """
+    Float remap tables sampling a pinhole view (yaw/pitch/horizontal fov in
+    degrees) from an equirectangular panorama of pano_size (width, height).
+    """
+    pano_w, pano_h = pano_size
+    out_w, out_h = out_size
+    focal = 0.5 * out_w / np.tan(np.radians(fov) / 2.0)
+
+    x = (np.arange(out_w, dtype=np.float64) - (out_w - 1) / 2.0) / focal
+    y = (np.arange(out_h, dtype=np.float64) - (out_h - 1) / 2.0) / focal
+    x, y = np.meshgrid(x, y)
+    rays = np.stack([x, -y, np.ones_like(x)], axis=-1)  # right, up, forward
+    rays /= np.linalg.norm(rays, axis=-1, keepdims=True)
+
+    # Tilt up by pitch (about the x axis), then turn right by yaw (about the y axis)
+    p, t = np.radians(pitch), np.radians(yaw)
+    rot_pitch = np.array([[1, 0, 0],
+                          [0, np.cos(p), np.sin(p)],
+                          [0, -np.sin(p), np.cos(p)]])
+    rot_yaw = np.array([[np.cos(t), 0, np.sin(t)],
+                        [0, 1, 0],
+                        [-np.sin(t), 0, np.cos(t)]])
+    rays = rays @ (rot_yaw @ rot_pitch).T
+
+    lon = np.arctan2(rays[..., 0], rays[..., 2])
+    lat = np.arcsin(np.clip(rays[..., 1], -1.0, 1.0))
+    map_x = (lon / (2.0 * np.pi) + 0.5) * pano_w - 0.5
+    map_y = np.clip((0.5 - lat / np.pi) * pano_h - 0.5, 0, pano_h - 1)
+    return map_x.astype(np.float32), map_y.astype(np.float32)
+
+
+class ProjectionCache:
+    """LRU cache of fixed-point perspective remap tables"""
+
+    def __init__(self, slots=None):
+        self.slots = slots or PROJECTION_CACHE_SLOTS
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, pano_size, out_size, yaw, pitch, fov):
+        key = (tuple(pano_size), tuple(out_size), float(yaw), float(pitch), float(fov))
+        with self._lock:
+            maps = self._maps.get(key)
+            if maps is not None:
+                self._maps.move_to_end(key)
+                self.stats["hits"] += 1
+                return maps
+            self.stats["misses"] += 1
+
+        map_x, map_y = perspective_maps(pano_size, out_size, yaw, pitch, fov)
+        # Tables index the panorama padded by one wrapped column (see wrap_columns)
+        maps = cv2.convertMaps(map_x + 1, map_y, cv2.CV_16SC2)
+        with self._lock:
+            self._maps[key] = maps
+            while len(self._maps) > self.slots:
+                self._maps.popitem(last=False)
+        return maps
+
+
+projection_cache = ProjectionCache()
+
+
+def wrap_columns(pano):
+    """Panorama with its last/first column copied past the left/right edge."""
+    return cv2.copyMakeBorder(pano, 0, 0, 1, 1, cv2.BORDER_WRAP)
+
+
+def _render(padded, pano_size, yaw, pitch, fov, size, cache):
+    map1, map2 = cache.get(pano_size, size, yaw, pitch, fov)
+    # Only longitude wraps (through the padding); latitude clamps at the poles
+    return cv2.remap(padded, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def extract_view(pano, yaw=0.0, pitch=0.0, fov=90.0, size=(1024, 768), cache=None):
+    """Render a perspective view of an equirectangular panorama."""
+    pano_h, pano_w = pano.shape[:2]
+    return _render(wrap_columns(pano), (pano_w, pano_h), yaw, pitch, fov, size, cache or projection_cache)
+
+
+def cubemap(pano, face_size=None, cache=None):
+    """Six 90-degree cube faces of an equirectangular panorama, keyed by face name."""
+    pano_h, pano_w = pano.shape[:2]
+    face_size = face_size or pano_w // 4
+    padded = wrap_columns(pano)
+    return OrderedDict((name, _render(padded, (pano_w, pano_h), yaw, pitch, 90.0, (face_size, face_size),
+                                      cache or projection_cache))
+                       for name, (yaw, pitch) in CUBE_FACES.items())
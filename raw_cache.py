@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Raw Cache
+On-disk cache of downloaded raw bracket files keyed by URL, so repeat merges
+against the same DNG URLs revalidate with a conditional GET (ETag /
+Last-Modified) instead of downloading hundreds of MB again. Decoded arrays
+can optionally be cached next to the raw file (RAW_CACHE_DECODED).
+
+Entries are shared by all workers: each URL is guarded by its own fcntl lock
+file, and files are written to a temporary name and renamed into place. The
+cache is capped at RAW_CACHE_QUOTA_MB with least recently used entries
+evicted first.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent
+RAW_CACHE_DIR = Path(os.environ.get("RAW_CACHE_DIR", PROJECT_ROOT / "utils" / "cache" / "raw"))
+RAW_CACHE_QUOTA_MB = int(os.environ.get("RAW_CACHE_QUOTA_MB", 2048))
+RAW_CACHE_DECODED = os.environ.get("RAW_CACHE_DECODED", "0") == "1"
+
+
+def link_or_copy(src, dest):
+    """Hard-link src to dest, copying (and logging why) when linking is not possible."""
+    try:
+        os.link(src, dest)
+    except FileNotFoundError:
+        raise
+    except OSError as e:
+        logger.warning(f"Copying {src} to {dest} instead of hard-linking: {e}")
+        shutil.copyfile(src, dest)
+
+
+class RawCache:
+    """URL-keyed, revalidated LRU cache of raw files (and optionally their decoded arrays)"""
+
+    def __init__(self, cache_dir=None, quota_mb=None, keep_decoded=None):
+        self.cache_dir = Path(cache_dir or RAW_CACHE_DIR)
+        self.quota_bytes = (quota_mb if quota_mb is not None else RAW_CACHE_QUOTA_MB) * 1024 * 1024
+        self.keep_decoded = RAW_CACHE_DECODED if keep_decoded is None else keep_decoded
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "decoded_hits": 0, "evictions": 0}
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def path_for(self, url):
+        return self.cache_dir / f"{self.key(url)}.raw"
+
+    def _meta_path(self, url):
+        return self.cache_dir / f"{self.key(url)}.json"
+
+    def record(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _lock_path(self, key):
+        return self.cache_dir / "locks" / f"{key}.lock"
+
+    @contextmanager
+    def lock(self, url):
+        """Exclusive lock on a URL's entry, across threads and worker processes."""
+        path = self._lock_path(self.key(url))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            f = open(path, "a")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # The lock file may have been removed while we waited; retry on the new one
+            try:
+                if os.fstat(f.fileno()).st_ino == path.stat().st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+        try:
+            yield
+        finally:
+            # Lock files are only kept while their URL has a cache entry
+            if not self.path_for(url).exists():
+                path.unlink(missing_ok=True)
+            f.close()
+
+    def _remove_lock(self, key):
+        """Remove an evicted entry's lock file, unless someone holds it."""
+        path = self._lock_path(key)
+        try:
+            fd = os.open(path, os.O_WRONLY)
+        except OSError:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def lookup(self, url):
+        """Validators of the cached entry for url ({"etag", "last_modified", "size"}), or None."""
+        try:
+            meta = json.loads(self._meta_path(url).read_text())
+            if self.path_for(url).stat().st_size != meta["size"]:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+        return meta
+
+    @staticmethod
+    def conditional_headers(meta):
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def staging_dir(self):
+        """
+        New private directory on the cache's filesystem for a request's
+        downloads, so cached files can be hard-linked into it instead of
+        copied. The caller removes it.
+        """
+        root = self.cache_dir / "staging"
+        root.mkdir(parents=True, exist_ok=True)
+        return Path(tempfile.mkdtemp(dir=root))
+
+    def tmp_path(self, url):
+        """Scratch path in the cache directory for a download that may be stored."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        return self.cache_dir / f".{self.key(url)}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def store(self, url, tmp_path, headers):
+        """
+        Move a completed download into the cache with its response validators.
+        Returns the cached path, or None (leaving tmp_path alone) when the
+        response cannot be revalidated later.
+        """
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return None
+        path = self.path_for(url)
+        meta = {"url": url, "etag": etag, "last_modified": last_modified,
+                "size": Path(tmp_path).stat().st_size}
+        for stale in self.cache_dir.glob(f"{self.key(url)}.*.npy"):
+            stale.unlink(missing_ok=True)
+        os.replace(tmp_path, path)
+        meta_tmp = self._meta_path(url).with_suffix(".json.tmp")
+        meta_tmp.write_text(json.dumps(meta))
+        os.replace(meta_tmp, self._meta_path(url))
+        self.record("stores")
+        self._evict(keep=path)
+        return path
+
+    def link(self, url, dest_path):
+        """Hard-link (or copy) the cached file to dest_path; False if the entry is gone."""
+        path = self.path_for(url)
+        try:
+            os.utime(path)  # LRU bookkeeping
+            link_or_copy(path, dest_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _decoded_path(self, url, options):
+        meta = self.lookup(url)
+        if meta is None:
+            return None
+        tag = json.dumps([meta["etag"], meta["last_modified"], options], sort_keys=True)
+        return self.cache_dir / f"{self.key(url)}.{hashlib.sha256(tag.encode()).hexdigest()[:16]}.npy"
+
+    def get_decoded(self, url, options):
+        """Cached decoded array of the current version of url for decode options, or None."""
+        path = self._decoded_path(url, options) if self.keep_decoded else None
+        if path is None:
+            return None
+        try:
+            os.utime(path)
+            img = np.load(path)
+        except (OSError, ValueError):
+            return None
+        self.record("decoded_hits")
+        return img
+
+    def put_decoded(self, url, options, img):
+        """Cache a decoded array of the current version of url."""
+        path = self._decoded_path(url, options) if self.keep_decoded else None
+        if path is None:
+            return
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, img)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            tmp_path.unlink(missing_ok=True)
+            logger.warning(f"Could not cache decoded bracket {url}: {e}")
+            return
+        self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        """Remove least recently used files until the cache fits its quota."""
+        entries = []
+        total = 0
+        for path in self.cache_dir.iterdir():
+            if path.name.startswith(".") or path.suffix not in (".raw", ".npy"):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.quota_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            if path.suffix == ".raw":
+                path.with_suffix(".json").unlink(missing_ok=True)
+                # Decoded arrays of the entry go with it
+                for decoded in self.cache_dir.glob(f"{path.stem}.*.npy"):
+                    try:
+                        decoded_size = decoded.stat().st_size
+                        decoded.unlink()
+                    except OSError:
+                        continue
+                    total -= decoded_size
+                self._remove_lock(path.stem)
+            self.record("evictions")
+            logger.info(f"Evicted cached raw file {path.name}")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Raw Decode
+Decodes camera raw files (DNG) straight into 16-bit BGR NumPy arrays in the
+worker process, so bracket data reaches the merge without TIFF round trips
+on disk.
+
+Decoding uses rawpy (LibRaw), which requirements.txt pins. If it cannot be
+imported, a warning is logged and dcraw streams a 16-bit PPM over its stdout
+pipe instead, which OpenCV decodes from memory.
+"""
+
+import logging
+import subprocess
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+try:
+    import rawpy
+except ImportError as e:
+    rawpy = None
+    logger.warning(f"rawpy unavailable ({e}); falling back to dcraw subprocess decoding")
+
+DCRAW_TIMEOUT = 60
+MAX_OPTIMIZED_SIZE = 4096
+# Demosaic quality, as dcraw's -q: 0 bilinear, 1 VNG, 2 PPG, 3 AHD
+DEMOSAIC_QUALITIES = (0, 1, 2, 3)
+EXIF_IFD_TAG = 0x8769
+EXPOSURE_TIME_TAG = 0x829A
+
+
+def _decode_rawpy(path, half_size, quality):
+    algorithms = [rawpy.DemosaicAlgorithm.LINEAR, rawpy.DemosaicAlgorithm.VNG,
+                  rawpy.DemosaicAlgorithm.PPG, rawpy.DemosaicAlgorithm.AHD]
+    try:
+        with rawpy.imread(str(path)) as raw:
+            rgb = raw.postprocess(use_camera_wb=True, output_bps=16, half_size=half_size,
+                                  demosaic_algorithm=algorithms[quality])
+    except (rawpy.LibRawError, OSError) as e:
+        raise RuntimeError(f"Error decoding raw file {path}: {e}")
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def _decode_dcraw(path, half_size, quality):
+    # -c stdout, -w camera white balance, -6 16-bit PPM, -h half-size
+    cmd = ['dcraw', '-c', '-w', '-6', '-q', str(quality)] + (['-h'] if half_size else []) + [str(path)]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                timeout=DCRAW_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"dcraw timeout for {path}")
+    except OSError as e:
+        raise RuntimeError(f"Error running dcraw: {e}")
+    if result.returncode != 0:
+        raise RuntimeError(f"dcraw failed for {path}: {result.stderr.decode(errors='replace')}")
+
+    img = cv2.imdecode(np.frombuffer(result.stdout, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise RuntimeError(f"dcraw produced no image for {path}")
+    return img
+
+
+def decode_raw(path, half_size=False, quality=3):
+    """
+    Decode a raw file to a 16-bit BGR array with the camera white balance.
+    half_size halves each dimension (skipping demosaicing); quality selects
+    the demosaic algorithm (see DEMOSAIC_QUALITIES).
+    """
+    # bool and float pass a plain membership test (True == 1, 3.0 == 3)
+    if not isinstance(quality, int) or isinstance(quality, bool) or quality not in DEMOSAIC_QUALITIES:
+        raise ValueError(f"Demosaic quality must be one of {DEMOSAIC_QUALITIES}")
+    if rawpy is not None:
+        img = _decode_rawpy(path, half_size, quality)
+    else:
+        img = _decode_dcraw(path, half_size, quality)
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return img
+
+
+def read_exposure_time(path):
+    """Exposure time in seconds from a DNG's TIFF/EXIF tags, or None if unavailable."""
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif()
+            value = exif.get(EXPOSURE_TIME_TAG) or exif.get_ifd(EXIF_IFD_TAG).get(EXPOSURE_TIME_TAG)
+            value = float(value) if value else None
+    except (OSError, SyntaxError, ValueError, ZeroDivisionError):
+        return None
+    return value if value and value > 0 else None
+
+
+def optimize_bracket(img, max_size=MAX_OPTIMIZED_SIZE):
+    """8-bit copy of a bracket that fits within max_size x max_size (never upscaled)."""
+    height, width = img.shape[:2]
+    scale = max_size / max(width, height)
+    if scale < 1:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    if img.dtype == np.uint16:
+        img = cv2.convertScaleAbs(img, alpha=1 / 257)
+    return img
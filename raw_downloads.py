@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Raw Downloads
+Concurrent downloader for HDR bracket files. All brackets are fetched in
+parallel by a bounded thread pool over one pooled requests.Session, so
+connections to the same host are kept alive and reused. With a RawCache,
+previously downloaded files are revalidated with conditional GETs.
+
+Every download starts with a ranged GET for its first segment. Servers that
+answer 206 have the remaining segments fetched concurrently into a
+preallocated file, and a failed segment resumes from its last written byte;
+servers that ignore ranges simply stream the whole file.
+"""
+
+import logging
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.utils import secure_filename
+
+from raw_cache import link_or_copy
+
+logger = logging.getLogger(__name__)
+
+HDR_DOWNLOAD_WORKERS = int(os.environ.get("HDR_DOWNLOAD_WORKERS", 4))
+HDR_DOWNLOAD_CHUNK_KB = int(os.environ.get("HDR_DOWNLOAD_CHUNK_KB", 1024))
+HDR_DOWNLOAD_TIMEOUT = int(os.environ.get("HDR_DOWNLOAD_TIMEOUT", 30))
+HDR_DOWNLOAD_SEGMENT_MB = float(os.environ.get("HDR_DOWNLOAD_SEGMENT_MB", 16))
+HDR_DOWNLOAD_SEGMENT_WORKERS = int(os.environ.get("HDR_DOWNLOAD_SEGMENT_WORKERS", 4))
+HDR_DOWNLOAD_RETRIES = int(os.environ.get("HDR_DOWNLOAD_RETRIES", 3))
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+USER_AGENT = "HDRMerge/1.0"
+
+
+class RawDownloader:
+    """Pooled, size-limited downloads of bracket files"""
+
+    def __init__(self, max_size_mb, workers=None, chunk_kb=None, timeout=None, cache=None,
+                 segment_mb=None, segment_workers=None):
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.cache = cache
+        self.workers = workers or HDR_DOWNLOAD_WORKERS
+        self.chunk_size = (chunk_kb or HDR_DOWNLOAD_CHUNK_KB) * 1024
+        self.timeout = timeout or HDR_DOWNLOAD_TIMEOUT
+        # segment_mb=0 disables ranged downloads
+        self.segment_size = int((HDR_DOWNLOAD_SEGMENT_MB if segment_mb is None else segment_mb) * 1024 * 1024)
+        self.segment_workers = segment_workers or HDR_DOWNLOAD_SEGMENT_WORKERS
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        pool_size = self.workers + self.segment_workers
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="raw-download")
+        # Separate pool: segments are submitted from inside download tasks
+        self._segment_executor = ThreadPoolExecutor(max_workers=self.segment_workers,
+                                                    thread_name_prefix="raw-segment")
+
+    def dest_path(self, url, dest_dir):
+        """Unique local path for a URL's file name."""
+        original_name = Path(url.split('?')[0]).name
+        return Path(dest_dir) / f"{uuid.uuid4().hex}_{secure_filename(original_name)}"
+
+    def _get(self, url, path, headers=None, ranged=True):
+        """
+        Download url into path with the size limit, in parallel segments when
+        the server supports ranges. Returns the first response (for its
+        headers), or None if a conditional request was answered with 304 Not
+        Modified.
+        """
+        max_size_mb = self.max_size_bytes / (1024 * 1024)
+        request_headers = dict(headers or {})
+        if ranged and self.segment_size:
+            # The first segment doubles as the probe for range support
+            request_headers["Range"] = f"bytes=0-{self.segment_size - 1}"
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout, headers=request_headers) as response:
+                if response.status_code == 304:
+                    return None
+                response.raise_for_status()
+
+                content_range = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+                if response.status_code == 206 and content_range is None:
+                    # Partial content of unknown total length: fetch the whole file instead
+                    return self._get(url, path, headers, ranged=False)
+
+                # Check content length
+                if response.status_code == 206:
+                    total = content_range.group(3)
+                else:
+                    total = response.headers.get('Content-Length')
+                if total and int(total) > self.max_size_bytes:
+                    size_mb = int(total) / (1024 * 1024)
+                    raise ValueError(f"File too large: {size_mb:.1f}MB (max {max_size_mb:g}MB)")
+
+                if response.status_code == 206:
+                    self._get_segments(url, path, response, int(content_range.group(2)), int(total))
+                else:
+                    self._stream(response, path)
+        except requests.RequestException as e:
+            Path(path).unlink(missing_ok=True)
+            raise RuntimeError(f"Failed to download {url}: {str(e)}")
+        except Exception:
+            Path(path).unlink(missing_ok=True)
+            raise
+
+        logger.info(f"Downloaded {url} ({Path(path).stat().st_size / 1024 / 1024:.1f}MB)")
+        return response
+
+    def _stream(self, response, path):
+        """Single-stream download of a full response body, with the size check."""
+        total_size = 0
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                total_size += len(chunk)
+                if total_size > self.max_size_bytes:
+                    raise ValueError("File exceeded size limit during download")
+                f.write(chunk)
+
+    def _get_segments(self, url, path, response, first_end, total):
+        """
+        Fetch a file of `total` bytes as concurrent byte ranges into a
+        preallocated file. `response` is the open 206 for bytes 0..first_end.
+        """
+        etag = response.headers.get('ETag')
+        # If-Range needs a strong validator; segments of a changed file fail instead of mixing versions
+        validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+        with open(path, 'wb') as f:
+            f.truncate(total)
+
+        futures = [self._segment_executor.submit(self._fetch_range, url, path, start,
+                                                 min(start + self.segment_size, total) - 1, validator)
+                   for start in range(first_end + 1, total, self.segment_size)]
+        errors = []
+        try:
+            self._fetch_range(url, path, 0, first_end, validator, response=response)
+        except Exception as e:
+            errors.append(e)
+        # Wait for every segment before returning, so none writes into a deleted file
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        if futures:
+            logger.info(f"Fetched {url} in {len(futures) + 1} ranged segments")
+
+    def _fetch_range(self, url, path, start, end, validator, response=None):
+        """
+        Download bytes start..end (inclusive) of url into path. After a failed
+        attempt the segment resumes from its last written byte, up to
+        HDR_DOWNLOAD_RETRIES times.
+        """
+        last_error = None
+        with open(path, 'r+b') as f:
+            f.seek(start)
+            for attempt in range(HDR_DOWNLOAD_RETRIES + 1):
+                try:
+                    if response is None:
+                        headers = {"Range": f"bytes={f.tell()}-{end}"}
+                        if validator:
+                            headers["If-Range"] = validator
+                        response = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+                    with response:
+                        if response.status_code != 206:
+                            raise RuntimeError(f"Range request for {url} answered with HTTP "
+                                               f"{response.status_code}; the file may have changed")
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk[:end + 1 - f.tell()])
+                            if f.tell() > end:
+                                break
+                except requests.RequestException as e:
+                    last_error = e
+                    logger.warning(f"Segment {start}-{end} of {url} failed at byte {f.tell()}: {e}")
+                finally:
+                    response = None
+                if f.tell() > end:
+                    return
+        raise RuntimeError(f"Failed to download {url} bytes {start}-{end}: {last_error}")
+
+    def download(self, url, dest_dir):
+        """Download a file from URL into dest_dir with the size limit; returns its path."""
+        dest_path = self.dest_path(url, dest_dir)
+        if self.cache is None:
+            self._get(url, dest_path)
+            return dest_path
+
+        with self.cache.lock(url):
+            meta = self.cache.lookup(url)
+            tmp_path = self.cache.tmp_path(url)
+            headers = self.cache.conditional_headers(meta) if meta else None
+            response = self._get(url, tmp_path, headers=headers)
+            if response is None:
+                if self.cache.link(url, dest_path):
+                    self.cache.record("hits")
+                    logger.info(f"Raw cache hit for {url} (not modified)")
+                    return dest_path
+                response = self._get(url, tmp_path)  # entry evicted meanwhile
+            self.cache.record("misses")
+            # Place the bracket before the cache takes tmp_path: another
+            # worker may evict the stored entry before it could be linked
+            link_or_copy(tmp_path, dest_path)
+            try:
+                self.cache.store(url, tmp_path, response.headers)
+            except OSError as e:
+                logger.warning(f"Could not cache raw file {url}: {e}")
+            finally:
+                Path(tmp_path).unlink(missing_ok=True)
+        return dest_path
+
+    def submit(self, url, dest_dir):
+        """Start a download on the pool; returns a Future for its path."""
+        return self._executor.submit(self.download, url, dest_dir)
+
+    def download_all(self, urls, dest_dir):
+        """Download all URLs concurrently; returns their paths in order."""
+        futures = [self.submit(url, dest_dir) for url in urls]
+        try:
+            return [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Result Cache
+Content-addressed on-disk cache of stitched panoramas. Entries are keyed by a
+SHA-256 of the uploaded bytes plus the stitch parameters, so a resubmitted
+capture is served without decoding or stitching it again.
+
+The cache directory is capped at RESULT_CACHE_QUOTA_MB and evicts the least
+recently used entries first (file mtime is refreshed on every hit).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent
+RESULT_CACHE_DIR = Path(os.environ.get("RESULT_CACHE_DIR",
+                                       PROJECT_ROOT / "utils" / "cache" / "results"))
+RESULT_CACHE_QUOTA_MB = int(os.environ.get("RESULT_CACHE_QUOTA_MB", 512))
+
+
+def result_key(data, params):
+    """Hash of the input bytes and the (JSON-serializable) parameters."""
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Size-capped LRU cache of result files on local disk"""
+
+    def __init__(self, cache_dir=None, quota_mb=None, suffix=".jpg"):
+        self.cache_dir = Path(cache_dir or RESULT_CACHE_DIR)
+        self.quota_bytes = (quota_mb if quota_mb is not None else RESULT_CACHE_QUOTA_MB) * 1024 * 1024
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def path_for(self, key):
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def get(self, key):
+        """Return the cached file path for key, or None on a miss."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # LRU bookkeeping
+        except OSError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        return path
+
+    def put(self, key, src_path):
+        """Copy a finished result file into the cache and enforce the size cap."""
+        return self._store(key, lambda tmp_path: shutil.copyfile(src_path, tmp_path))
+
+    def put_bytes(self, key, data):
+        """Store an in-memory result in the cache and enforce the size cap."""
+        return self._store(key, lambda tmp_path: Path(tmp_path).write_bytes(data))
+
+    def _store(self, key, write):
+        path = self.path_for(key)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            write(tmp_path)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self.stats["stores"] += 1
+            self._evict(keep=path)
+        except OSError as e:
+            logger.warning(f"Could not cache result {key}: {e}")
+            return None
+        return path
+
+    def _evict(self, keep=None):
+        """Remove least recently used entries until the cache fits its quota."""
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob(f"*{self.suffix}"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.quota_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+            logger.info(f"Evicted cached result {path.name}")
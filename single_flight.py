@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Single Flight
+Coalesces concurrent calls that share a key: the first caller runs the
+computation and every duplicate that arrives while it is running waits for
+and receives the same result (or exception).
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Per-key deduplication of in-flight computations"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def do(self, key, fn):
+        """Run fn once per key at a time; returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.stats["leaders"] += 1
+                leader = True
+            else:
+                self.stats["followers"] += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Number of computations currently running."""
+        with self._lock:
+            return len(self._calls)
@@ -404,6 +404,62 @@ FisheyeStitcher::createBlendMask()
 
 }   // createBlendMask()
 
+//! 
+//! @brief Precompute the seam ramps as full-height alpha masks
+//! 
+//!     Update member m_blend_alpha (weight of the left image, blendLeft ramp
+//!     on the left seam, blendRight ramp on the right seam) and m_blend_band.
+//!
+void
+FisheyeStitcher::createBlendAlpha()
+{
+    int H = m_binary_mask.size().height;
+    int W = m_binary_mask.size().width;
+    int sideW = 45; // width in pixels
+    int w = 2 * sideW;
+    double wdb = static_cast<double>(w);
+
+    cv::Mat alpha = cv::Mat::zeros(H, W, CV_32F);
+    cv::Mat band  = cv::Mat::zeros(H, W, CV_8U);
+
+    int rows = std::min(H, static_cast<int>(m_blend_post.size()));
+    for (int r = 0; r < rows; ++r)
+    {
+        int p = m_blend_post[r];
+        if (p == 0)
+        {
+            continue;
+        }
+        float *a = alpha.ptr<float>(r);
+        uchar *b = band.ptr<uchar>(r);
+        // Left boundary
+        for (int c = 0; c < w; ++c)
+        {
+            int col = p - sideW + c;
+            if (col >= 0 && col < W)
+            {
+                a[col] = static_cast<float>((wdb - c + 1) / wdb);
+                b[col] = 255;
+            }
+        }
+        // Right boundary (written last, as in the per-row blend)
+        for (int c = 0; c < w; ++c)
+        {
+            int col = W - p - sideW + c;
+            if (col >= 0 && col < W)
+            {
+                a[col] = static_cast<float>(c / wdb);
+                b[col] = 255;
+            }
+        }
+    }
+
+    cv::Mat alpha_ch[3] = {alpha, alpha, alpha};
+    cv::merge(alpha_ch, 3, m_blend_alpha);
+    band.copyTo(m_blend_band);
+
+}   // createBlendAlpha()
+
 // 
 // @brief Initialize common parameters for stitching
 // 
@@ -425,6 +481,7 @@ FisheyeStitcher::init()
     // Creat masks that used in blending the deformed images                  //
     //------------------------------------------------------------------------//
     createBlendMask();  // update m_blend_post, m_binary_mask
+    createBlendAlpha(); // update m_blend_alpha, m_blend_band
 
     //------------------------------------------------------------------------//
     // Create scale_map for fisheye light fall-off compensation               //
@@ -693,16 +750,13 @@ FisheyeStitcher::blend( const cv::Mat &left_img,
     int imW = left_img.size().width;
     cv::Mat left_img_cr = left_img(cv::Rect(imW / 2 + 1 - Worg / 2, 0, Worg, imH));
 
+#if GEAR360_C200 
     int sideW = 45; // width in pixels
     cv::Mat left_blend, right_blend;
 
     for (int r = 0; r < H; ++r)
     {
-#if GEAR360_C200 
         int p = post.at<float>(r, 0);
-#else
-        int p = m_blend_post[r];
-#endif
         if (p == 0)
         {
             continue;
@@ -724,6 +778,26 @@ FisheyeStitcher::blend( const cv::Mat &left_img,
         bright.copyTo(lf_win_2);
         bright.copyTo(rt_win_2);
     }
+#else
+    //-----------------------------------------------------------------------//
+    // Ramp blending over the precomputed seam bands (whole frame at once)   //
+    //-----------------------------------------------------------------------//
+    cv::Rect seam_roi(0, 0, Worg, imH);
+    cv::Mat alpha = m_blend_alpha(seam_roi);
+    cv::Mat band  = m_blend_band(seam_roi);
+    cv::Mat alpha_n;
+    cv::subtract(cv::Scalar::all(1.0), alpha, alpha_n);
+
+    cv::Mat left_f, right_f;
+    left_img_cr.convertTo(left_f, CV_32FC3);
+    right_img_aligned.convertTo(right_f, CV_32FC3);
+    cv::Mat blended_f = left_f.mul(alpha) + right_f.mul(alpha_n);
+    cv::Mat blended;
+    blended_f.convertTo(blended, CV_8UC3);
+
+    blended.copyTo(left_img_cr, band);
+    blended.copyTo(right_img_aligned, band);
+#endif
 
 #if MY_DEBUG
     cv::imwrite("left_crop_blend.jpg", left_img_cr);
@@ -3,29 +3,13 @@
 
 echo "Starting Fisheye Stitcher Service..."
 
-# Check required tools
-if ! command -v dcraw &> /dev/null; then
-    echo "ERROR: dcraw not found. DNG processing will fail."
-    exit 1
-fi
-
-if ! command -v convert &> /dev/null && ! command -v magick &> /dev/null; then
-    echo "ERROR: ImageMagick not found."
-    exit 1
-fi
-
-echo "✓ dcraw found: $(dcraw 2>&1 | head -n1)"
-echo "✓ ImageMagick found"
-
-# Ensure the binary exists
-if [ ! -f "/app/build/bin/fisheyeStitcher" ]; then
-    echo "Building fisheye stitcher binary..."
-    cd /app
-    mkdir -p build
-    cd build
-    cmake ..
-    make -j4
-    cd ..
+# DNGs are decoded with rawpy; dcraw is only the fallback when rawpy is missing
+if python3 -c "import rawpy" &> /dev/null; then
+    echo "✓ rawpy available for DNG decoding"
+elif command -v dcraw &> /dev/null; then
+    echo "WARNING: rawpy not importable; DNGs will be decoded with dcraw: $(dcraw 2>&1 | head -n1)"
+else
+    echo "WARNING: neither rawpy nor dcraw is available. DNG processing will fail."
 fi
 
 # Create necessary directories
@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+"""
+Fisheye Stitch Engine
+In-process port of the C++ FisheyeStitcher (src/fisheye_stitcher.cpp).
+
+All calibration maps are built once when the stitcher is created, so a
+long-lived instance only pays for the remap/blend stages per frame.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from mls_cache import load_mls_maps
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent
+MLS_MAP_PATH = PROJECT_ROOT / "utils" / "grid_xd_yd_3840x1920.yml.gz"
+
+MAX_FOVD = 195.0
+
+# Native dual-fisheye resolution the MLS grid and hard-coded params target
+NATIVE_WIDTH = 3840
+NATIVE_HEIGHT = 1920
+
+# Light fall-off polynomial coefficients
+P1_ = -7.5625e-17
+P2_ = 1.9589e-13
+P3_ = -1.8547e-10
+P4_ = 6.1997e-08
+P5_ = -6.9432e-05
+P6_ = 0.9976
+
+# Refine-alignment search
+ALIGN_PYRAMID_LEVELS = 3     # coarse-to-fine template matching levels
+ALIGN_MIN_TEMPLATE = 8       # smallest template side kept in the pyramid
+ALIGN_SEARCH_RADIUS = 2      # refinement window (pixels) at each finer level
+ALIGN_SCORE_TOLERANCE = 0.02 # allowed NCC drop before a cached alignment is redone
+# Cameras whose alignment is kept per stitcher (least recently used evicted)
+ALIGN_CACHE_SLOTS = int(os.environ.get("ALIGN_CACHE_SLOTS", 64))
+
+
+# Arrays that make up a calibration map set (see export_maps/from_maps)
+MAP_ARRAYS = ("m_map_x", "m_map_y", "m_cir_mask", "m_inner_cir_mask",
+              "m_binary_mask", "m_blend_post", "m_blend_rows", "m_blend_cols",
+              "m_blend_alpha", "m_scale_map", "m_left_map1", "m_left_map2",
+              "m_right_map1", "m_right_map2")
+
+
+class FisheyeStitcher:
+    """Dual-fisheye to equirectangular stitcher with precomputed maps"""
+
+    def __init__(self, width, height, in_fovd=MAX_FOVD, enb_light_compen=False,
+                 enb_refine_align=False, map_path=MLS_MAP_PATH, maps=None, align_cache_slots=None):
+        if width % 2 != 0 or height % 2 != 0:
+            raise ValueError("Frame width and height must be even")
+
+        self.m_ws_org = width
+        self.m_hs_org = height
+        self.m_in_fovd = float(in_fovd)
+        self.m_inner_fovd = self.m_in_fovd - 12.0  # used in creating mask
+        self.m_enb_light_compen = enb_light_compen
+        self.m_enb_refine_align = enb_refine_align
+        self.m_map_path = map_path
+
+        # Last good refine-alignment per camera (see _refine_align)
+        self.m_alignment = OrderedDict()
+        self.m_alignment_slots = align_cache_slots or ALIGN_CACHE_SLOTS
+        self.m_alignment_lock = threading.Lock()
+        self.m_alignment_stats = {"reused": 0, "searched": 0}
+
+        # Source images
+        self.m_ws = width // 2  # e.g. 1920
+        self.m_hs = height      # e.g. 1920
+        if self.m_ws % 2 != 0 or self.m_hs % 2 != 0:
+            raise ValueError("Single fisheye width and height must be even")
+        self.m_ws2 = self.m_ws // 2
+        self.m_hs2 = self.m_hs // 2
+
+        # Destination pano
+        self.m_wd = int(self.m_ws * 360.0 / self.m_in_fovd)
+        self.m_hd = self.m_wd // 2
+        self.m_wd2 = self.m_wd // 2
+        self.m_hd2 = self.m_hd // 2
+
+        if maps is not None:
+            self._load_maps(maps)
+        else:
+            logger.info(f"Initializing stitcher maps for {width}x{height} @ {self.m_in_fovd} deg...")
+            self._init()
+
+    @classmethod
+    def from_maps(cls, width, height, in_fovd, maps, **kwargs):
+        """Create a stitcher from a previously exported map set."""
+        return cls(width, height, in_fovd, maps=maps, **kwargs)
+
+    def export_maps(self):
+        """Return the calibration map set as a dict of arrays."""
+        maps = {name: getattr(self, name) for name in MAP_ARRAYS}
+        maps["m_blend_post"] = np.asarray(self.m_blend_post, dtype=np.int32)
+        return maps
+
+    def _load_maps(self, maps):
+        """Adopt an exported map set instead of rebuilding it."""
+        for name in MAP_ARRAYS:
+            setattr(self, name, maps[name])
+        self.m_blend_post = [int(p) for p in maps["m_blend_post"]]
+        self.m_left_maps = (self.m_left_map1, self.m_left_map2)
+        self.m_right_maps = (self.m_right_map1, self.m_right_map2)
+
+    def _scaled(self, value):
+        """Scale a parameter tuned for 3840x1920 input to the current frame size."""
+        return max(1, int(round(value * self.m_ws / (NATIVE_WIDTH // 2))))
+
+    # ------------------------------------------------------------------ #
+    # Initialization                                                     #
+    # ------------------------------------------------------------------ #
+    def _init(self):
+        """Build every map the per-frame stages need."""
+        self._fish2map()           # m_map_x, m_map_y
+        self._create_mask()        # m_cir_mask, m_inner_cir_mask
+        self._create_blend_mask()  # m_blend_post, m_binary_mask
+        self._gen_scale_map()      # m_scale_map
+        self._load_mls_grid()      # m_mls_map_x, m_mls_map_y
+        self._compose_maps()       # m_left_maps, m_right_maps
+        del self.m_mls_map_x, self.m_mls_map_y  # folded into m_right_maps
+
+    def _load_mls_grid(self):
+        """Load the MLS grid, fitted to this resolution (identity if there is none)."""
+        h_t, w_t = self.m_hd - 2, self.m_ws
+        if self.m_map_path is None:
+            self.m_mls_map_x, self.m_mls_map_y = np.meshgrid(
+                np.arange(w_t, dtype=np.float32), np.arange(h_t, dtype=np.float32))
+            return
+
+        mls_map_x, mls_map_y = load_mls_maps(self.m_map_path)
+        h_s, w_s = mls_map_x.shape[:2]
+        if (h_s, w_s) != (h_t, w_t):
+            # Grid was calibrated at another resolution: resample and rescale it
+            logger.info(f"Rescaling MLS grid {w_s}x{h_s} -> {w_t}x{h_t}")
+            sx, sy = w_t / w_s, h_t / h_s
+            mls_map_x = (cv2.resize(np.asarray(mls_map_x), (w_t, h_t)) + 0.5) * sx - 0.5
+            mls_map_y = (cv2.resize(np.asarray(mls_map_y), (w_t, h_t)) + 0.5) * sy - 0.5
+        self.m_mls_map_x, self.m_mls_map_y = mls_map_x, mls_map_y
+
+    def _fish2map(self):
+        """Map 2D fisheye image to 2D projected sphere (reference: Panotool)."""
+        w_rad = self.m_wd / (2.0 * np.pi)
+        w2 = self.m_wd2 - 0.5
+        h2 = self.m_hd2 - 0.5
+        ws2 = self.m_ws2 - 0.5
+        hs2 = self.m_hs2 - 0.5
+
+        x_d, y_d = np.meshgrid(np.arange(self.m_wd, dtype=np.float64) - w2,
+                               np.arange(self.m_hd, dtype=np.float64) - h2)
+
+        phi = x_d / w_rad
+        theta = -y_d / w_rad + np.pi / 2
+
+        below = theta < 0
+        theta[below] = -theta[below]
+        phi[below] += np.pi
+        above = theta > np.pi
+        theta[above] = np.pi - (theta[above] - np.pi)
+        phi[above] += np.pi
+
+        s = np.sin(theta)
+        v0 = s * np.sin(phi)
+        v1 = np.cos(theta)
+        r = np.sqrt(v0 * v0 + v1 * v1)
+        theta = w_rad * np.arctan2(r, s * np.cos(phi))
+
+        self.m_map_x = (theta * v0 / r + ws2).astype(np.float32)
+        self.m_map_y = (theta * v1 / r + hs2).astype(np.float32)
+
+    def _compose_maps(self):
+        """
+        Fold the per-frame warps into one fixed-point remap table per lens:
+        left = unwarp + half swap, right = unwarp + crop + MLS deform.
+        """
+        hd, wd2, ws = self.m_hd, self.m_wd2, self.m_ws
+
+        # Left: unwarp, then swap the two halves of the panorama
+        left_x = np.hstack([self.m_map_x[:hd - 2, wd2:2 * wd2], self.m_map_x[:hd - 2, :wd2]])
+        left_y = np.hstack([self.m_map_y[:hd - 2, wd2:2 * wd2], self.m_map_y[:hd - 2, :wd2]])
+
+        # Right: sample the cropped unwarp grid through the MLS grid
+        x_r = self.m_wd // 2 - ws // 2
+        crop_x = np.ascontiguousarray(self.m_map_x[:hd - 2, x_r:x_r + ws])
+        crop_y = np.ascontiguousarray(self.m_map_y[:hd - 2, x_r:x_r + ws])
+        mls_x = np.asarray(self.m_mls_map_x, dtype=np.float32)
+        mls_y = np.asarray(self.m_mls_map_y, dtype=np.float32)
+        right_x = cv2.remap(crop_x, mls_x, mls_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        right_y = cv2.remap(crop_y, mls_x, mls_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+        # MLS samples outside the crop were black in the two-pass pipeline
+        outside = ((mls_x < 0) | (mls_x > ws - 1) | (mls_y < 0) | (mls_y > hd - 3))
+        right_x[outside] = -1
+        right_y[outside] = -1
+
+        self.m_left_map1, self.m_left_map2 = cv2.convertMaps(left_x, left_y, cv2.CV_16SC2)
+        self.m_right_map1, self.m_right_map2 = cv2.convertMaps(right_x, right_y, cv2.CV_16SC2)
+        self.m_left_maps = (self.m_left_map1, self.m_left_map2)
+        self.m_right_maps = (self.m_right_map1, self.m_right_map2)
+
+    def _create_mask(self):
+        """Circular masks cropping the image data inside the FOVD circle."""
+        w_shift = int(np.floor((self.m_ws * (self.m_in_fovd - self.m_inner_fovd) / self.m_in_fovd) / 2.0))
+        r1 = self.m_ws2
+        r2 = self.m_ws2 - w_shift * 2
+        center = (self.m_ws2, self.m_ws2)
+
+        self.m_cir_mask = np.zeros((self.m_hs, self.m_ws, 3), np.uint8)
+        self.m_inner_cir_mask = np.zeros((self.m_hs, self.m_ws, 3), np.uint8)
+        cv2.circle(self.m_cir_mask, center, r1, (255, 255, 255), -1, 8, 0)
+        cv2.circle(self.m_inner_cir_mask, center, r2, (255, 255, 255), -1, 8, 0)
+
+    def _create_blend_mask(self):
+        """Binary mask and per-row blend posts used when blending the seams."""
+        ring_mask = cv2.bitwise_and(self.m_cir_mask, cv2.bitwise_not(self.m_inner_cir_mask))
+        ring_mask_unwarped = cv2.remap(ring_mask, self.m_map_x, self.m_map_y,
+                                       cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT,
+                                       borderValue=(0, 0, 0))
+
+        x0 = self.m_wd2 - self.m_ws2
+        mask_ = ring_mask_unwarped[:, x0:x0 + self.m_ws].copy()
+        H_, W_ = mask_.shape[:2]
+
+        # Tuned for dual-fisheye images of size 3840x1920
+        first_zero_col = self._scaled(120)  # first cidx that mask value is zero
+        first_zero_row = self._scaled(45)   # first ridx that mask value is zero
+
+        # Clean up the top half between the seams
+        mask_[:H_ // 2, first_zero_col:W_ - first_zero_col + 1] = 0
+
+        # Blend posts: first zero column of each row, minus an offset
+        offset = self._scaled(15)
+        margin = self._scaled(10)
+        c_start = first_zero_col - margin
+        c_end = W_ // 2 + margin
+        blend_post = []
+        for ridx in range(H_):
+            if ridx > H_ - first_zero_row:
+                blend_post.append(0)
+                continue
+            zeros = np.flatnonzero(~mask_[ridx, c_start:c_end].any(axis=1))
+            blend_post.append(int(zeros[0]) + c_start - offset if zeros.size else 0)
+
+        self.m_blend_post = blend_post
+        self.m_binary_mask = mask_
+        self._create_blend_alpha()
+
+    def _create_blend_alpha(self):
+        """
+        Precompute the seam ramps as per-pixel alpha (weight of the left image)
+        over both seam bands, stored as (rows, cols, alpha) of the band pixels.
+        """
+        H_, W_ = self.m_binary_mask.shape[:2]
+        im_h = self.m_hd - 2
+        side_w = self._scaled(45)
+        w = 2 * side_w
+        ramp_left = (w - np.arange(w) + 1) / w
+        ramp_right = np.arange(w) / w
+
+        posts = np.asarray(self.m_blend_post[:min(H_, im_h)])
+        rows = np.flatnonzero(posts)
+        posts = posts[rows]
+
+        # NaN marks pixels outside the bands; the right ramp is written last
+        alpha = np.full((im_h, W_), np.nan, np.float32)
+        offsets = np.arange(w)
+        for starts, ramp in ((posts - side_w, ramp_left), (W_ - posts - side_w, ramp_right)):
+            cols = starts[:, None] + offsets
+            valid = (cols >= 0) & (cols < W_)
+            alpha[np.broadcast_to(rows[:, None], cols.shape)[valid], cols[valid]] = \
+                np.broadcast_to(ramp, cols.shape)[valid]
+
+        band_rows, band_cols = np.nonzero(~np.isnan(alpha))
+        self.m_blend_rows = band_rows.astype(np.int32)
+        self.m_blend_cols = band_cols.astype(np.int32)
+        self.m_blend_alpha = alpha[band_rows, band_cols]
+
+    def _gen_scale_map(self):
+        """
+        Scale map for fisheye light fall-off compensation. The circular crop is
+        folded in (zero outside the FOVD circle) so crop + compensation is a
+        single multiply per frame.
+        """
+        W_ = self.m_ws2
+        H_ = self.m_hs2
+        x_coor = np.arange(W_, dtype=np.float32)
+        r_pf = (P1_ * x_coor ** 5 + P2_ * x_coor ** 4 + P3_ * x_coor ** 3 +
+                P4_ * x_coor ** 2 + P5_ * x_coor + P6_).astype(np.float32)
+        r_pf = 1.0 / r_pf  # reverse light fall-off profile
+
+        # IV quadrant: average of the profile at the two nearest integer radii
+        x, y = np.meshgrid(np.arange(W_), np.arange(H_))
+        r = np.floor(np.sqrt(x * x + y * y)).astype(np.int64)
+        inside = r < W_ - 1
+        r = np.where(inside, r, 0)
+        quad_4 = np.where(inside, (r_pf[r] + r_pf[r + 1]) / 2.0, r_pf[W_ - 1]).astype(np.float32)
+
+        # Assume optical symmetry and flip
+        quad_1 = np.flipud(quad_4)
+        quad_3 = np.fliplr(quad_4)
+        quad_2 = np.fliplr(quad_1)
+        scale_map = np.vstack([np.hstack([quad_2, quad_1]),
+                               np.hstack([quad_3, quad_4])])
+
+        crop = (self.m_cir_mask[..., 0] > 0).astype(np.float32)
+        self.m_scale_map = cv2.merge([scale_map * crop] * 3)
+
+    # ------------------------------------------------------------------ #
+    # Per-frame stages                                                   #
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _remap(src, maps):
+        """Single remap pass through a fixed-point (CV_16SC2 + table) map pair."""
+        return cv2.remap(src, maps[0], maps[1], cv2.INTER_LINEAR,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+
+    def _compen_light_fo(self, in_img):
+        """Circular crop + fisheye light fall-off compensation in one multiply."""
+        return cv2.multiply(in_img, self.m_scale_map, dtype=cv2.CV_8U)
+
+    @staticmethod
+    def _match_score(ref, tmpl, loc):
+        """
+        Zero-mean normalized correlation of tmpl placed on ref at loc. Unlike
+        plain NCC it goes negative for inverted content, so a flipped or
+        swapped frame reads as drift.
+        """
+        x, y = loc
+        h, w = tmpl.shape[:2]
+        patch = ref[y:y + h, x:x + w]
+        if patch.shape[:2] != (h, w):
+            return 0.0
+        return float(cv2.matchTemplate(patch, tmpl, cv2.TM_CCOEFF_NORMED)[0, 0])
+
+    @staticmethod
+    def _find_match_loc(ref, tmpl, levels=ALIGN_PYRAMID_LEVELS):
+        """
+        Adaptive alignment: coarse-to-fine normalized cross-correlation.
+        Full search at the coarsest pyramid level, then a small window around
+        the upsampled peak at each finer level. Returns (location, score).
+        """
+        refs, tmpls = [ref], [tmpl]
+        for _ in range(levels):
+            if min(tmpls[-1].shape[:2]) // 2 < ALIGN_MIN_TEMPLATE:
+                break
+            refs.append(cv2.pyrDown(refs[-1]))
+            tmpls.append(cv2.pyrDown(tmpls[-1]))
+
+        result = cv2.matchTemplate(refs[-1], tmpls[-1], cv2.TM_CCORR_NORMED)
+        _, score, _, (x, y) = cv2.minMaxLoc(result)
+
+        for level in range(len(refs) - 2, -1, -1):
+            r, t = refs[level], tmpls[level]
+            max_x = r.shape[1] - t.shape[1]
+            max_y = r.shape[0] - t.shape[0]
+            x0 = min(max(2 * x - ALIGN_SEARCH_RADIUS, 0), max_x)
+            x1 = min(max(2 * x + ALIGN_SEARCH_RADIUS, 0), max_x)
+            y0 = min(max(2 * y - ALIGN_SEARCH_RADIUS, 0), max_y)
+            y1 = min(max(2 * y + ALIGN_SEARCH_RADIUS, 0), max_y)
+            window = r[y0:y1 + t.shape[0], x0:x1 + t.shape[1]]
+            result = cv2.matchTemplate(window, t, cv2.TM_CCORR_NORMED)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(result)
+            x, y = x0 + dx, y0 + dy
+
+        return (x, y), score
+
+    @staticmethod
+    def _create_control_points(match_loc_left, match_loc_right, row_start, row_end,
+                               p_wid, p_x1, p_x2, p_x2_ref):
+        """Construct control points (moving on reference, fixed on template)."""
+        x1, y1 = match_loc_left
+        x2, y2 = match_loc_right
+        moving_points = np.float32([
+            # Left boundary
+            (x1, y1 + row_start), (x1 + p_wid, y1 + row_start),
+            (x1, y1 + row_end), (x1 + p_wid, y1 + row_end),
+            # Right boundary
+            (x2 + p_x2_ref, y2 + row_start), (x2 + p_x2_ref + p_wid, y2 + row_start),
+            (x2 + p_x2_ref, y2 + row_end), (x2 + p_x2_ref + p_wid, y2 + row_end),
+        ])
+        fixed_points = np.float32([
+            (p_x1, row_start), (p_x1 + p_wid, row_start),
+            (p_x1, row_end), (p_x1 + p_wid, row_end),
+            (p_x2, row_start), (p_x2 + p_wid, row_start),
+            (p_x2, row_end), (p_x2 + p_wid, row_end),
+        ])
+        return moving_points, fixed_points
+
+    def _blend(self, left_img, right_img_aligned):
+        """
+        Blend the re-arranged left image with the aligned right image.
+        left_img is reused as the output panorama.
+        """
+        worg = self.m_ws
+        im_h, im_w = left_img.shape[:2]
+        x_cr = im_w // 2 + 1 - worg // 2
+        left_img_cr = left_img[:, x_cr:x_cr + worg]
+
+        # Mask composite of both lenses
+        mask_ = self.m_binary_mask[:im_h]
+        seam = cv2.bitwise_or(cv2.bitwise_and(left_img_cr, mask_),
+                              cv2.bitwise_and(right_img_aligned, cv2.bitwise_not(mask_)))
+
+        # Ramp blending over the precomputed seam bands
+        rows, cols = self.m_blend_rows, self.m_blend_cols
+        alpha = self.m_blend_alpha[:, None]
+        blended = (alpha * left_img_cr[rows, cols] +
+                   (1.0 - alpha) * right_img_aligned[rows, cols])
+        seam[rows, cols] = np.clip(np.rint(blended), 0, 255).astype(np.uint8)
+
+        x0 = im_w // 2 - worg // 2
+        left_img[:, x0:x0 + worg] = seam
+        return left_img
+
+    def stitch(self, in_img_l, in_img_r, light_compen=None, refine_align=None, align_key=None,
+               check_drift=True):
+        """Stitch one pair of fisheye frames into an equirectangular panorama."""
+        if light_compen is None:
+            light_compen = self.m_enb_light_compen
+        if refine_align is None:
+            refine_align = self.m_enb_refine_align
+
+        if light_compen:
+            # Circular crop + light fall-off compensation
+            left = self._compen_light_fo(in_img_l)
+            right = self._compen_light_fo(in_img_r)
+        else:
+            # Circular crop
+            left = cv2.bitwise_and(in_img_l, self.m_cir_mask)
+            right = cv2.bitwise_and(in_img_r, self.m_cir_mask)
+
+        # Fisheye unwarping + rearrangement (left), unwarping + MLS deformation (right)
+        left_unwarped_arr = self._remap(left, self.m_left_maps)
+        right_deformed = self._remap(right, self.m_right_maps)
+
+        if refine_align:
+            right_deformed = self._refine_align(left_unwarped_arr, right_deformed, align_key, check_drift)
+
+        return self._blend(left_unwarped_arr, right_deformed)
+
+    def _refine_align(self, left_unwarped_arr, right_deformed, align_key=None, check_drift=True):
+        """
+        Warp the deformed right image onto the left using template matching.
+        The last good alignment per align_key (camera) is reused while its
+        match score at the cached locations stays within tolerance. With
+        check_drift=False a cached alignment is reused without any matching.
+        Without an align_key every frame is searched and nothing is cached.
+        """
+        w_in = self.m_ws
+        x_l = self.m_wd2 - w_in // 2
+        left_crop = left_unwarped_arr[:, x_l:x_l + w_in]
+        crop = int(0.5 * self.m_ws * (self.m_in_fovd - 180.0) / self.m_in_fovd)  # half overlap region
+
+        # Empirical parameters for dual-fisheye images of size 3840x1920
+        p_wid = self._scaled(55)
+        p_x1 = self._scaled(90 - 15)
+        p_x2 = self._scaled(1780 - 5)
+        p_x1_ref = 2 * crop
+        row_start = self._scaled(590)
+        row_end = self._scaled(1320)
+        p_x2_ref = self.m_ws - 2 * crop + 1
+
+        ref_1 = left_crop[row_start:row_end, 0:p_x1_ref]
+        ref_2 = left_crop[row_start:row_end, p_x2_ref:self.m_ws]
+        tmpl_1 = right_deformed[row_start:row_end, p_x1:p_x1 + p_wid]
+        tmpl_2 = right_deformed[row_start:row_end, p_x2:p_x2 + p_wid]
+
+        cached = None
+        if align_key is not None:
+            with self.m_alignment_lock:
+                cached = self.m_alignment.get(align_key)
+                if cached is not None:
+                    self.m_alignment.move_to_end(align_key)
+
+        tform_refine_mat = None
+        if cached is not None and not check_drift:
+            tform_refine_mat = cached["tform"]
+        elif cached is not None:
+            # Drift: largest correlation drop at the cached match locations
+            drift = max(
+                cached["score_left"] - self._match_score(ref_1, tmpl_1, cached["match_loc_left"]),
+                cached["score_right"] - self._match_score(ref_2, tmpl_2, cached["match_loc_right"]))
+            with self.m_alignment_lock:
+                cached["drift"] = drift
+            if drift <= ALIGN_SCORE_TOLERANCE:
+                tform_refine_mat = cached["tform"]
+
+        if tform_refine_mat is not None:
+            with self.m_alignment_lock:
+                self.m_alignment_stats["reused"] += 1
+        else:
+            match_loc_left, _ = self._find_match_loc(ref_1, tmpl_1)
+            match_loc_right, _ = self._find_match_loc(ref_2, tmpl_2)
+
+            moving_points, fixed_points = self._create_control_points(
+                match_loc_left, match_loc_right, row_start, row_end,
+                p_wid, p_x1, p_x2, p_x2_ref)
+            tform_refine_mat, _ = cv2.findHomography(fixed_points, moving_points, 0)
+
+            with self.m_alignment_lock:
+                self.m_alignment_stats["searched"] += 1
+            if align_key is not None:
+                # Baseline scores on the same zero-mean scale the drift check uses
+                score_left = self._match_score(ref_1, tmpl_1, match_loc_left)
+                score_right = self._match_score(ref_2, tmpl_2, match_loc_right)
+                with self.m_alignment_lock:
+                    self.m_alignment[align_key] = {
+                        "match_loc_left": match_loc_left,
+                        "match_loc_right": match_loc_right,
+                        "score_left": score_left,
+                        "score_right": score_right,
+                        "moving_points": moving_points,
+                        "fixed_points": fixed_points,
+                        "tform": tform_refine_mat,
+                        "drift": 0.0,
+                        "searches": cached["searches"] + 1 if cached else 1,
+                    }
+                    self.m_alignment.move_to_end(align_key)
+                    while len(self.m_alignment) > self.m_alignment_slots:
+                        evicted, _ = self.m_alignment.popitem(last=False)
+                        logger.info(f"Evicted refine-alignment for camera {evicted}")
+
+        h, w = right_deformed.shape[:2]
+        return cv2.warpPerspective(right_deformed, tform_refine_mat, (w, h), flags=cv2.INTER_LINEAR)
+
+    def stitch_frame(self, img, light_compen=None, refine_align=None, align_key=None, check_drift=True):
+        """Split a side-by-side dual-fisheye frame and stitch it."""
+        h, w = img.shape[:2]
+        if (w, h) != (self.m_ws_org, self.m_hs_org):
+            raise ValueError(f"Frame is {w}x{h}, stitcher was built for "
+                             f"{self.m_ws_org}x{self.m_hs_org}")
+        return self.stitch(img[:, :w // 2], img[:, w // 2:], light_compen, refine_align, align_key,
+                           check_drift)
+
+    def alignment(self, align_key):
+        """Cached refine-alignment state for a camera (drift, searches, ...) or None."""
+        with self.m_alignment_lock:
+            cached = self.m_alignment.get(align_key)
+            return dict(cached) if cached else None
+
+    def forget_alignment(self, align_key):
+        """Drop the cached refine-alignment for a camera."""
+        with self.m_alignment_lock:
+            self.m_alignment.pop(align_key, None)
+
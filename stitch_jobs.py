@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Stitch Jobs
+Asynchronous stitch jobs run by a bounded worker pool. Submissions beyond
+STITCH_QUEUE_DEPTH waiting jobs are rejected immediately with QueueFull so the
+web workers can answer 503 instead of blocking.
+
+Job state and results live on disk under STITCH_JOB_DIR, so any gunicorn
+worker can answer status and download requests for a job. The process that
+owns an unfinished job refreshes its heartbeat every STITCH_HEARTBEAT seconds;
+a job whose heartbeat is older than STITCH_JOB_STALE (its worker process died
+or was restarted) is reported as failed.
+"""
+
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+STITCH_JOB_DIR = Path(os.environ.get("STITCH_JOB_DIR", Path(tempfile.gettempdir()) / "stitch_jobs"))
+STITCH_WORKERS = int(os.environ.get("STITCH_WORKERS", 2))
+STITCH_QUEUE_DEPTH = int(os.environ.get("STITCH_QUEUE_DEPTH", 8))
+STITCH_JOB_TTL = int(os.environ.get("STITCH_JOB_TTL", 3600))  # seconds a finished job is kept
+STITCH_RETRY_AFTER = int(os.environ.get("STITCH_RETRY_AFTER", 5))
+STITCH_HEARTBEAT = float(os.environ.get("STITCH_HEARTBEAT", 10))  # seconds between heartbeats
+STITCH_JOB_STALE = float(os.environ.get("STITCH_JOB_STALE", 60))  # heartbeat age of an abandoned job
+
+_JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+class QueueFull(RuntimeError):
+    """Raised when the stitch queue cannot accept another job."""
+
+
+class StitchJobQueue:
+    """Bounded queue of stitch jobs served by a fixed pool of threads"""
+
+    def __init__(self, job_dir=None, workers=None, depth=None, ttl=None, heartbeat=None, stale_after=None):
+        self.job_dir = Path(job_dir or STITCH_JOB_DIR)
+        self.workers = workers or STITCH_WORKERS
+        self.ttl = ttl if ttl is not None else STITCH_JOB_TTL
+        self.heartbeat = heartbeat or STITCH_HEARTBEAT
+        self.stale_after = stale_after or STITCH_JOB_STALE
+        self._owned = set()  # unfinished jobs of this process
+        self._queue = queue.Queue(maxsize=depth or STITCH_QUEUE_DEPTH)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._status_locks = {}
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"stitch-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._beat, name="stitch-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _beat(self):
+        """Refresh the heartbeat of this process's unfinished jobs."""
+        while True:
+            time.sleep(self.heartbeat)
+            with self._lock:
+                owned = list(self._owned)
+            for job_id in owned:
+                try:
+                    self._write_status(job_id, heartbeat=time.time())
+                except OSError as e:
+                    logger.warning(f"Could not refresh heartbeat of stitch job {job_id}: {e}")
+
+    @staticmethod
+    def new_job_id():
+        return uuid.uuid4().hex
+
+    def submit(self, fn, *args, job_id=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs). It returns the result as JPEG bytes, or the
+        path of a result file, which is moved into the job dir. Returns the job id.
+        """
+        self._start_workers()
+        self._expire()
+
+        job_id = job_id or self.new_job_id()
+        (self.job_dir / job_id).mkdir(parents=True)
+        now = time.time()
+        self._write_status(job_id, status="queued", submitted=now, owner=os.getpid(), heartbeat=now)
+        with self._lock:
+            self._owned.add(job_id)
+        try:
+            self._queue.put_nowait((job_id, fn, args, kwargs))
+        except queue.Full:
+            shutil.rmtree(self.job_dir / job_id, ignore_errors=True)
+            with self._lock:
+                self._owned.discard(job_id)
+                self.stats["rejected"] += 1
+            raise QueueFull(f"Stitch queue is full ({self._queue.maxsize} jobs waiting)")
+
+        with self._lock:
+            self.stats["submitted"] += 1
+        return job_id
+
+    def _worker(self):
+        while True:
+            job_id, fn, args, kwargs = self._queue.get()
+            started = time.time()
+            self._write_status(job_id, status="processing", started=started)
+            try:
+                result = fn(*args, **kwargs)
+                if isinstance(result, (bytes, bytearray)):
+                    result_name = "result.jpg"
+                    _write_atomic(self.job_dir / job_id / result_name, result)
+                else:
+                    result_name = f"result{Path(result).suffix}"
+                    shutil.move(str(result), self.job_dir / job_id / result_name)
+                with self._lock:
+                    self.stats["completed"] += 1
+                self._write_status(job_id, status="complete", result=result_name,
+                                   finished=time.time(), seconds=round(time.time() - started, 3))
+            except Exception as e:
+                logger.error(f"Stitch job {job_id} failed: {e}")
+                with self._lock:
+                    self.stats["failed"] += 1
+                self._write_status(job_id, status="error", error=str(e), finished=time.time())
+            finally:
+                with self._lock:
+                    self._owned.discard(job_id)
+                self._queue.task_done()
+
+    def update(self, job_id, **fields):
+        """Merge progress fields into a job's status."""
+        self._write_status(job_id, **fields)
+
+    def _status_lock(self, job_id):
+        with self._lock:
+            return self._status_locks.setdefault(job_id, threading.Lock())
+
+    def _write_status(self, job_id, **fields):
+        # Worker and progress callbacks both read-modify-write the status file
+        status_path = self.job_dir / job_id / "status.json"
+        with self._status_lock(job_id):
+            try:
+                status = json.loads(status_path.read_text())
+            except (OSError, ValueError):
+                status = {"job_id": job_id}
+            status.update(fields)
+            _write_atomic(status_path, json.dumps(status).encode())
+
+    def status(self, job_id):
+        """Job status dict, or None for an unknown job."""
+        if not _JOB_ID_RE.fullmatch(job_id):
+            return None
+        try:
+            status = json.loads((self.job_dir / job_id / "status.json").read_text())
+        except (OSError, ValueError):
+            return None
+        if (status.get("status") in ("queued", "processing") and
+                time.time() - status.get("heartbeat", status.get("submitted", 0)) > self.stale_after):
+            # The owning worker process is gone; give pollers a final state
+            logger.warning(f"Stitch job {job_id} abandoned by worker process {status.get('owner')}")
+            try:
+                self._write_status(job_id, status="error", finished=time.time(),
+                                   error="Worker process exited before the job finished")
+            except OSError:
+                return None  # expired meanwhile
+            return self.status(job_id)
+        return status
+
+    def result_path(self, job_id):
+        """Path of a finished job's result, or None."""
+        status = self.status(job_id)
+        if status is None or status["status"] != "complete":
+            return None
+        return self.job_dir / job_id / status.get("result", "result.jpg")
+
+    def depth(self):
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def _expire(self):
+        """Remove complete and failed jobs that finished more than the TTL ago."""
+        if not self.job_dir.exists():
+            return
+        cutoff = time.time() - self.ttl
+        for path in self.job_dir.iterdir():
+            status = self.status(path.name)
+            if status is None or status.get("status") not in ("complete", "error"):
+                continue  # queued and processing jobs are kept however long they take
+            if status.get("finished", 0) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                with self._lock:
+                    self._status_locks.pop(path.name, None)
+
+
+def _write_atomic(path, data):
+    """Write bytes next to path and rename into place."""
+    tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
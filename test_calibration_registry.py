@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the calibration map registry
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+import calibration_registry
+from calibration_registry import CalibrationRegistry, mls_fingerprint, scaled_size
+
+TEST_IMAGE_PATH = Path(__file__).parent / "input" / "image.jpg"
+
+
+@pytest.fixture
+def frame():
+    return cv2.imread(str(TEST_IMAGE_PATH), cv2.IMREAD_COLOR)
+
+
+def test_memory_then_disk_hits(tmp_path, frame):
+    h, w = frame.shape[:2]
+    registry = CalibrationRegistry(cache_dir=tmp_path)
+    built = registry.get(w, h, profile="generic")
+    assert registry.get(w, h, profile="generic") is built
+    assert registry.stats["builds"] == 1
+    assert registry.stats["memory_hits"] == 1
+
+    # A second worker maps the persisted set instead of rebuilding it
+    other = CalibrationRegistry(cache_dir=tmp_path)
+    loaded = other.get(w, h, profile="generic")
+    assert other.stats == {"memory_hits": 0, "disk_hits": 1, "builds": 0, "evictions": 0}
+    assert np.array_equal(loaded.stitch_frame(frame), built.stitch_frame(frame))
+
+
+def test_keys_by_resolution_and_fov(tmp_path, frame):
+    h, w = frame.shape[:2]
+    registry = CalibrationRegistry(cache_dir=tmp_path, memory_slots=1)
+    small = registry.get(w, h, profile="generic")
+    wide = registry.get(w, h, fovd=200, profile="generic")
+    assert small is not wide
+    assert wide.m_wd < small.m_wd
+    assert registry.stats["evictions"] == 1
+    assert registry.loaded() == [(w, h, 200.0, "generic")]
+
+    big = registry.get(2 * w, 2 * h, profile="generic")
+    assert big.stitch_frame(cv2.resize(frame, (2 * w, 2 * h))).shape[1] > 2 * small.m_wd2
+
+
+def test_fov_rounded_and_build_locks_dropped(tmp_path):
+    registry = CalibrationRegistry(cache_dir=tmp_path)
+    first = registry.get(720, 360, fovd=190.0001, profile="generic")
+    assert registry.get(720, 360, fovd=189.9, profile="generic") is first
+    assert registry.loaded() == [(720, 360, 190.0, "generic")]
+    assert registry.stats["builds"] == 1
+    assert registry._build_locks == {}
+
+
+def test_disk_quota_evicts_oldest(tmp_path):
+    registry = CalibrationRegistry(cache_dir=tmp_path, disk_quota_mb=1)
+    registry.get(720, 360, profile="generic")
+    registry.get(960, 480, profile="generic")
+    entries = [p for p in tmp_path.iterdir() if p.is_dir()]
+    assert len(entries) == 1
+    assert "960x480" in entries[0].name
+
+
+def test_rejects_unknown_profile(tmp_path):
+    registry = CalibrationRegistry(cache_dir=tmp_path)
+    with pytest.raises(ValueError):
+        registry.get(720, 360, profile="no-such-camera")
+    with pytest.raises(ValueError):
+        registry.get(720, 360, fovd=90, profile="generic")
+
+
+def test_preload_builds_preview_scales(tmp_path, frame):
+    h, w = frame.shape[:2]
+    registry = CalibrationRegistry(cache_dir=tmp_path)
+    registry.preload(2 * w, 2 * h, profile="generic")
+    assert registry.stats["builds"] == 3
+    assert registry.loaded() == [(2 * w, 2 * h, 195.0, "generic"),
+                                 (w, h, 195.0, "generic"),
+                                 (w // 2, h // 2, 195.0, "generic")]
+
+    preview = registry.get(*scaled_size(2 * w, 2 * h, 4), profile="generic")
+    pano = preview.stitch_frame(cv2.resize(frame, (w // 2, h // 2), interpolation=cv2.INTER_AREA))
+    assert pano.shape[1] == 2 * preview.m_wd2
+    assert registry.stats["memory_hits"] == 1
+
+
+def test_mls_fingerprint_tracks_grid_contents(tmp_path, monkeypatch):
+    grid = tmp_path / "grid.yml.gz"
+    grid.write_bytes(b"first grid")
+    monkeypatch.setitem(calibration_registry.CAMERA_PROFILES, "test",
+                        {"fovd": 195.0, "mls_map_path": grid})
+    first = mls_fingerprint("test")
+    assert first == mls_fingerprint("test")
+
+    grid.write_bytes(b"second grid, replaced")
+    assert mls_fingerprint("test") not in (None, first)
+    assert mls_fingerprint("generic") is None
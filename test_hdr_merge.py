@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Tests for the NumPy HDR merge engine
+"""
+
+import tracemalloc
+
+import cv2
+import numpy as np
+import pytest
+
+from hdr_merge import (MEDIAN_STRIP_ROWS, align_brackets, auto_level, create_merge,
+                       estimate_exposures, exposure_times, render_8bit, to_8bit, write_jpeg)
+
+
+@pytest.fixture
+def brackets():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (MEDIAN_STRIP_ROWS + 40, 64, 3), dtype=np.uint8) for _ in range(5)]
+
+
+@pytest.mark.parametrize("method,reference", [
+    ("mean", lambda s: np.rint(s.mean(axis=0))),
+    ("median", lambda s: np.median(s, axis=0)),
+    ("min", lambda s: s.min(axis=0)),
+    ("max", lambda s: s.max(axis=0)),
+])
+def test_merge_matches_numpy(brackets, method, reference):
+    merger = create_merge(method)
+    for img in brackets:
+        merger.add(img)
+    result = merger.result()
+    assert result.dtype == np.uint8
+    expected = reference(np.stack(brackets).astype(np.float64))
+    assert np.abs(result.astype(np.float64) - expected).max() <= 0.5
+
+
+def test_merge_errors(brackets):
+    with pytest.raises(ValueError):
+        create_merge("blend")
+    with pytest.raises(ValueError):
+        create_merge("mean").result()
+    merger = create_merge("mean")
+    merger.add(brackets[0])
+    with pytest.raises(ValueError):
+        merger.add(brackets[0][:10])
+
+
+def test_auto_level_and_jpeg(tmp_path):
+    img = np.array([[[40, 80, 120]]], dtype=np.uint8).repeat(8, axis=0).repeat(8, axis=1)
+    leveled = auto_level(img)
+    assert leveled.min() == 0 and leveled.max() == 255
+    assert auto_level(np.full((4, 4, 3), 7, np.uint8)).max() == 7
+
+    wide = auto_level((img.astype(np.uint16) * 257))
+    assert wide.dtype == np.uint16 and wide.max() == 65535
+
+    write_jpeg(wide, tmp_path / "out.jpg")
+    assert cv2.imread(str(tmp_path / "out.jpg")).shape == img.shape
+
+
+@pytest.fixture(scope="module")
+def exposure_brackets():
+    """Three shifted exposures (t = 0.5, 1, 2) of a synthetic high dynamic range scene"""
+    rng = np.random.default_rng(1)
+    height, width = 600, 900
+    ramp = np.exp(np.linspace(np.log(0.02), 0, width, dtype=np.float32))[None, :].repeat(height, axis=0)
+    texture = cv2.GaussianBlur(rng.random((height, width), dtype=np.float32), (0, 0), 3)
+    texture = 0.6 + 0.8 * (texture - texture.min()) / (texture.max() - texture.min())
+    shapes = np.ones((height, width), np.float32)
+    for _ in range(40):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(shapes, center, int(rng.integers(10, 60)), float(rng.uniform(0.3, 1.5)), -1)
+    radiance = np.dstack([ramp * texture * shapes] * 3)
+
+    brackets = []
+    for t, (dx, dy) in [(0.5, (-6, 4)), (1.0, (0, 0)), (2.0, (8, -2))]:
+        img = (np.clip(radiance * t, 0, 1) ** (1 / 2.2) * 255).astype(np.uint8)
+        shift = np.float32([[1, 0, dx], [0, 1, dy]])
+        brackets.append(cv2.warpAffine(img, shift, (width, height), borderMode=cv2.BORDER_REFLECT))
+    return brackets
+
+
+@pytest.mark.parametrize("method", ["mtb", "ecc"])
+def test_align_brackets_recovers_shifts(exposure_brackets, method):
+    aligned, shifts = align_brackets(exposure_brackets, method, max_side=450)
+    expected = [(6, -4), (0, 0), (-8, 2)]
+    for (dx, dy), (ex, ey) in zip(shifts, expected):
+        assert abs(dx - ex) <= 2 and abs(dy - ey) <= 2
+    assert all(img.shape == exposure_brackets[0].shape for img in aligned)
+
+
+def test_exposure_times(exposure_brackets):
+    times = estimate_exposures(exposure_brackets)
+    assert times[1] / times[0] == pytest.approx(2, rel=0.15)
+    assert times[2] / times[1] == pytest.approx(2, rel=0.15)
+    assert exposure_times(exposure_brackets, [0.01, 0.02, 0.04]) == [0.01, 0.02, 0.04]
+    assert exposure_times(exposure_brackets, [0.01, None, 0.04]) == times
+
+
+@pytest.mark.parametrize("method", ["mertens", "debevec", "robertson"])
+def test_hdr_methods(exposure_brackets, method):
+    merger = create_merge(method, align="mtb")
+    for img in exposure_brackets:
+        merger.add(img)
+    result = merger.result()
+    assert result.shape == exposure_brackets[0].shape
+    assert result.dtype == np.uint8
+    assert not merger.stretch
+    assert 20 < result.mean() < 235
+    assert merger.shifts[1] == (0.0, 0.0)
+
+    with pytest.raises(ValueError):
+        create_merge(method, align="sift")
+
+
+@pytest.mark.parametrize("method", ["mean", "median", "min", "max"])
+def test_out_of_core_merge_matches_in_memory(tmp_path, method):
+    rng = np.random.default_rng(2)
+    brackets = [rng.integers(0, 65536, (100, 512, 3), dtype=np.uint16) for _ in range(3)]
+    merger = create_merge(method, scratch_dir=tmp_path / "scratch")
+    merger.strip_bytes = 64 * 1024
+    in_memory = create_merge(method)
+    for img in brackets:
+        merger.add(img)
+        in_memory.add(img)
+    assert merger.strip_rows() < 100
+
+    result = merger.result()
+    assert result.dtype == np.uint16
+    assert np.abs(result.astype(np.int32) - in_memory.result()).max() <= 1
+    assert (render_8bit(result) == to_8bit(auto_level(np.asarray(result)))).all()
+
+    merger.close()
+    assert not (tmp_path / "scratch").exists()
+
+
+def test_out_of_core_merge_bounds_memory(tmp_path):
+    shape = (600, 1000, 3)
+    bracket_bytes = int(np.prod(shape)) * 2
+    merger = create_merge("median", scratch_dir=tmp_path)
+    merger.strip_bytes = 1024 * 1024
+    for value in (1000, 20000, 40000, 60000):
+        merger.add(np.full(shape, value, dtype=np.uint16))
+
+    tracemalloc.start()
+    try:
+        out = render_8bit(merger.result())
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        merger.close()
+    assert out.shape == shape
+    # The four 16-bit brackets are never loaded together
+    assert peak < 2 * bracket_bytes
+
+    with pytest.raises(ValueError):
+        create_merge("mertens", scratch_dir=tmp_path)
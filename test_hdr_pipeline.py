@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for the overlapped HDR bracket pipeline
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from hdr_merge import create_merge
+from hdr_pipeline import HDRBracketPipeline
+from raw_downloads import RawDownloader
+
+STAGE_SECONDS = 0.2
+
+
+class BracketHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        time.sleep(STAGE_SECONDS)
+        with cls.lock:
+            cls.active -= 1
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TimedPipeline(HDRBracketPipeline):
+    """Stage stand-ins that take a fixed time and record concurrency"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def _work(self, img):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(STAGE_SECONDS)
+        with self.lock:
+            self.active -= 1
+        return img
+
+    def decode(self, dng_path, half_size=False, quality=3):
+        data = Path(dng_path).read_bytes()
+        Path(dng_path).unlink()
+        if b"bad" in data:
+            return None
+        return self._work(np.frombuffer(data, dtype=np.uint8))
+
+    def optimize(self, img):
+        return self._work(img)
+
+
+@pytest.fixture
+def server():
+    BracketHandler.peak = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), BracketHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_brackets_overlap_stages(tmp_path, server):
+    pipeline = TimedPipeline(RawDownloader(1, workers=5), cpu_slots=5)
+    urls = [f"{server}/b{i}.dng" for i in range(5)]
+    start = time.perf_counter()
+    images = pipeline.run(urls, tmp_path)
+    elapsed = time.perf_counter() - start
+
+    assert [img.tobytes() for img in images] == [f"/b{i}.dng".encode() for i in range(5)]
+    # Sequential phases would take 15 stage times; overlapped brackets take ~3
+    assert elapsed < 8 * STAGE_SECONDS
+
+
+def test_cpu_budget_and_failed_decodes(tmp_path, server):
+    pipeline = TimedPipeline(RawDownloader(1, workers=4), cpu_slots=2)
+    urls = [f"{server}/b{i}.dng" for i in range(3)] + [f"{server}/bad.dng"]
+    images = pipeline.run(urls, tmp_path)
+
+    assert len(images) == 3
+    assert list(tmp_path.iterdir()) == []
+    assert pipeline.peak <= 2
+
+
+def test_downloads_bounded_by_downloader_pool(tmp_path, server):
+    pipeline = TimedPipeline(RawDownloader(1, workers=1), cpu_slots=4)
+    urls = [f"{server}/b{i}.dng" for i in range(3)]
+    assert len(pipeline.run(urls, tmp_path)) == 3
+    assert BracketHandler.peak == 1
+
+
+def test_merge_streams_brackets(tmp_path, server):
+    pipeline = TimedPipeline(RawDownloader(1, workers=4), cpu_slots=4)
+    merger = create_merge("max")
+    urls = [f"{server}/b{i}.dng" for i in range(3)] + [f"{server}/bad.dng"]
+    assert pipeline.merge(urls, tmp_path, merger) == 3
+    assert merger.result().tobytes() == b"/b2.dng"
+
+
+def test_full_resolution_brackets_spill_inside_cpu_slot(tmp_path, server):
+    pipeline = TimedPipeline(RawDownloader(1, workers=4), cpu_slots=1)
+    held = []
+
+    class SlotCheckingMerge:
+        def add(self, img, exposure=None):
+            # With one slot, the adding thread must still hold it
+            free = pipeline._cpu.acquire(blocking=False)
+            if free:
+                pipeline._cpu.release()
+            held.append(not free)
+
+    urls = [f"{server}/b{i}.dng" for i in range(3)]
+    assert pipeline.merge(urls, tmp_path, SlotCheckingMerge(), full_resolution=True) == 3
+    assert held == [True, True, True]
+
+
+def test_full_resolution_decodes_bounded_by_memory_budget(tmp_path, server):
+    pipeline = TimedPipeline(RawDownloader(1, workers=4), cpu_slots=4,
+                             memory_budget_mb=400, bracket_mb=200)
+    assert pipeline.full_res_slots == 2
+
+    class DiscardingMerge:
+        def add(self, img, exposure=None):
+            pass
+
+    urls = [f"{server}/b{i}.dng" for i in range(4)]
+    assert pipeline.merge(urls, tmp_path, DiscardingMerge(), full_resolution=True) == 4
+    assert pipeline.peak <= 2
+
+
+def test_mismatched_bracket_sizes_name_the_bracket(tmp_path, server):
+    pipeline = TimedPipeline(RawDownloader(1, workers=2), cpu_slots=2)
+    urls = [f"{server}/b0.dng", f"{server}/b10.dng"]
+    with pytest.raises(ValueError, match=r"b1?0\.dng: Bracket size \(\d+,\)"):
+        pipeline.merge(urls, tmp_path, create_merge("mean"))
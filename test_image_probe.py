@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for header-only image probing
+"""
+
+from io import BytesIO
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_probe import ImageInfo, probe_image
+
+TEST_IMAGE_PATH = Path(__file__).parent / "input" / "image.jpg"
+
+
+def encode(ext, img):
+    ok, buf = cv2.imencode(ext, img)
+    assert ok
+    return buf.tobytes()
+
+
+@pytest.mark.parametrize("ext, img, expected", [
+    (".png", np.zeros((30, 50, 3), np.uint8), ImageInfo("png", 50, 30, 3, 8)),
+    (".png", np.zeros((30, 50), np.uint16), ImageInfo("png", 50, 30, 1, 16)),
+    (".png", np.zeros((30, 50, 4), np.uint8), ImageInfo("png", 50, 30, 4, 8)),
+    (".bmp", np.zeros((30, 50, 3), np.uint8), ImageInfo("bmp", 50, 30, 3, 8)),
+    (".jpg", np.zeros((30, 50), np.uint8), ImageInfo("jpeg", 50, 30, 1, 8)),
+])
+def test_probe_matches_encoded_image(ext, img, expected):
+    assert probe_image(encode(ext, img)) == expected
+
+
+def test_probe_jpeg_with_exif_and_progressive():
+    img = Image.new("RGB", (64, 32))
+    exif = Image.Exif()
+    exif[0x010E] = "x" * 5000  # large APP1 segment before the frame header
+    buf = BytesIO()
+    img.save(buf, format="JPEG", exif=exif, progressive=True)
+    assert probe_image(buf.getvalue()) == ImageInfo("jpeg", 64, 32, 3, 8)
+
+
+def test_probe_file_and_stream():
+    info = probe_image(TEST_IMAGE_PATH)
+    assert (info.width, info.height, info.channels) == (720, 360, 3)
+    with open(TEST_IMAGE_PATH, "rb") as f:
+        f.read(10)
+        assert probe_image(f) == info
+        assert f.tell() == 10
+
+
+def test_probe_rejects_junk_and_truncated():
+    assert probe_image(b"") is None
+    assert probe_image(b"not an image") is None
+    assert probe_image(encode(".png", np.zeros((4, 4), np.uint8))[:20]) is None
+    assert probe_image(TEST_IMAGE_PATH.read_bytes()[:100]) is None
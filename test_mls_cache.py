@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped MLS grid cache
+"""
+
+import os
+
+import numpy as np
+
+from mls_cache import cache_paths, load_mls_maps, read_mls_yaml
+from test_stitch_engine import write_identity_mls_map
+
+
+def test_cache_matches_yaml(tmp_path):
+    map_path = write_identity_mls_map(tmp_path / "grid.yml.gz", 720, 360)
+    cache_dir = tmp_path / "cache"
+
+    map_x, map_y = load_mls_maps(map_path, cache_dir)
+    ref_x, ref_y = read_mls_yaml(map_path)
+
+    assert isinstance(map_x, np.memmap)
+    assert np.array_equal(map_x, ref_x)
+    assert np.array_equal(map_y, ref_y)
+    assert cache_paths(map_path, cache_dir)[0].exists()
+
+
+def test_cache_reused_when_source_unchanged(tmp_path):
+    map_path = write_identity_mls_map(tmp_path / "grid.yml.gz", 720, 360)
+    cache_dir = tmp_path / "cache"
+    npy_path = cache_paths(map_path, cache_dir)[0]
+
+    load_mls_maps(map_path, cache_dir)
+    built_at = npy_path.stat().st_mtime_ns
+
+    # Touching the source without changing it only refreshes the metadata
+    os.utime(map_path, ns=(built_at + 10**9, built_at + 10**9))
+    load_mls_maps(map_path, cache_dir)
+    assert npy_path.stat().st_mtime_ns == built_at
+
+
+def test_cache_rebuilt_when_source_changes(tmp_path):
+    map_path = write_identity_mls_map(tmp_path / "grid.yml.gz", 720, 360)
+    cache_dir = tmp_path / "cache"
+    load_mls_maps(map_path, cache_dir)
+
+    write_identity_mls_map(map_path, 1440, 720)
+    map_x, _ = load_mls_maps(map_path, cache_dir)
+    assert map_x.shape == read_mls_yaml(map_path)[0].shape
+
+
+def test_same_named_grids_get_separate_entries(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    first = write_identity_mls_map(tmp_path / "a" / "grid.yml.gz", 720, 360)
+    second = write_identity_mls_map(tmp_path / "b" / "grid.yml.gz", 1440, 720)
+    cache_dir = tmp_path / "cache"
+    assert cache_paths(first, cache_dir)[0] != cache_paths(second, cache_dir)[0]
+
+    load_mls_maps(first, cache_dir)
+    load_mls_maps(second, cache_dir)
+    npy_path = cache_paths(first, cache_dir)[0]
+    built_at = npy_path.stat().st_mtime_ns
+    assert load_mls_maps(first, cache_dir)[0].shape == read_mls_yaml(first)[0].shape
+    assert npy_path.stat().st_mtime_ns == built_at
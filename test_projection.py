@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Tests for perspective and cubemap extraction
+"""
+
+import cv2
+import numpy as np
+
+from projection import ProjectionCache, cubemap, extract_view, perspective_maps
+
+
+def gradient_pano(width=720, height=360):
+    """Panorama whose blue channel encodes longitude and green channel latitude."""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    pano = np.zeros((height, width, 3), np.uint8)
+    pano[..., 0] = x[None, :]
+    pano[..., 1] = y[:, None]
+    return pano
+
+
+def test_view_centers_follow_yaw_and_pitch():
+    pano = gradient_pano()
+    h, w = pano.shape[:2]
+    faces = cubemap(pano, face_size=65)
+    assert list(faces) == ["front", "right", "back", "left", "up", "down"]
+    assert all(face.shape == (65, 65, 3) for face in faces.values())
+
+    assert np.abs(faces["front"][32, 32].astype(int) - pano[h // 2, w // 2]).max() <= 2
+    assert np.abs(int(faces["right"][32, 32, 0]) - int(pano[h // 2, 3 * w // 4, 0])) <= 2
+    assert np.abs(int(faces["left"][32, 32, 0]) - int(pano[h // 2, w // 4, 0])) <= 2
+    assert faces["up"][32, 32, 1] <= 2
+    assert faces["down"][32, 32, 1] >= 253
+
+
+def test_cached_fixed_point_maps_match_float_remap():
+    pano = gradient_pano()
+    cache = ProjectionCache(slots=2)
+    view = extract_view(pano, yaw=30, pitch=10, fov=70, size=(160, 120), cache=cache)
+    again = extract_view(pano, yaw=30, pitch=10, fov=70, size=(160, 120), cache=cache)
+    assert np.array_equal(view, again)
+    assert cache.stats == {"hits": 1, "misses": 1}
+
+    map_x, map_y = perspective_maps((720, 360), (160, 120), 30, 10, 70)
+    expected = cv2.remap(pano, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
+    assert np.abs(view.astype(int) - expected.astype(int)).max() <= 1
+
+    # Looking across the +-180 degree seam samples both panorama edges
+    back = extract_view(pano, yaw=180, fov=90, size=(64, 64), cache=cache)
+    assert back[32, :20, 0].min() > 200 and back[32, -20:, 0].max() < 50
+
+
+def test_poles_do_not_wrap_vertically():
+    # Only the bottom row is bright: views of the north pole must never sample it
+    pano = np.zeros((360, 720, 3), np.uint8)
+    pano[-1] = 255
+    faces = cubemap(pano, face_size=64)
+    assert faces["up"].max() == 0
+    assert extract_view(pano, pitch=90, fov=170, size=(64, 64)).max() == 0
+    assert extract_view(pano, pitch=-90, size=(65, 65))[32, 32].min() == 255
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Tests for the URL-keyed raw download cache
+"""
+
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from raw_cache import RawCache
+from raw_downloads import RawDownloader
+
+
+class ValidatingHandler(BaseHTTPRequestHandler):
+    """Serves FILES with ETags and answers If-None-Match with 304"""
+
+    protocol_version = "HTTP/1.1"
+    files = {}
+    bodies_sent = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.files[self.path]
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with_validator = not self.path.startswith("/plain")
+        if with_validator and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        type(self).bodies_sent += 1
+        self.send_response(200)
+        if with_validator:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    ValidatingHandler.files = {"/a.dng": b"a" * 50000, "/b.dng": b"b" * 50000, "/plain.dng": b"p" * 100}
+    ValidatingHandler.bodies_sent = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ValidatingHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_revalidates_instead_of_downloading(tmp_path, server):
+    cache = RawCache(tmp_path / "cache", quota_mb=10)
+    downloader = RawDownloader(1, workers=4, cache=cache)
+    urls = [f"{server}/a.dng"] * 4
+
+    # Concurrent requests for one URL wait on its lock and revalidate the stored copy
+    paths = downloader.download_all(urls, tmp_path)
+    assert ValidatingHandler.bodies_sent == 1
+    assert cache.stats["misses"] == 1 and cache.stats["hits"] == 3
+    assert all(p.read_bytes() == b"a" * 50000 for p in paths)
+
+    # Deleting a request's copy leaves the cache entry intact
+    paths[0].unlink()
+    assert downloader.download(urls[0], tmp_path).read_bytes() == b"a" * 50000
+    assert ValidatingHandler.bodies_sent == 1
+
+    # A changed file gets a new ETag and is fetched again
+    ValidatingHandler.files["/a.dng"] = b"A" * 40000
+    assert downloader.download(urls[0], tmp_path).read_bytes() == b"A" * 40000
+    assert ValidatingHandler.bodies_sent == 2
+
+
+def test_unvalidated_responses_are_not_cached(tmp_path, server):
+    cache = RawCache(tmp_path / "cache", quota_mb=10)
+    downloader = RawDownloader(1, cache=cache)
+    for _ in range(2):
+        assert downloader.download(f"{server}/plain.dng", tmp_path).read_bytes() == b"p" * 100
+    assert ValidatingHandler.bodies_sent == 2
+    assert cache.lookup(f"{server}/plain.dng") is None
+
+
+def test_lru_quota_and_decoded_arrays(tmp_path, server):
+    cache = RawCache(tmp_path / "cache", quota_mb=0.07, keep_decoded=True)
+    downloader = RawDownloader(1, cache=cache)
+    downloader.download(f"{server}/a.dng", tmp_path)
+    downloader.download(f"{server}/b.dng", tmp_path)
+    assert cache.lookup(f"{server}/a.dng") is None
+    assert cache.lookup(f"{server}/b.dng") is not None
+    assert cache.stats["evictions"] == 1
+
+    url = f"{server}/b.dng"
+    options = {"half_size": True, "quality": 3}
+    img = np.arange(12, dtype=np.uint16).reshape(2, 2, 3)
+    cache.quota_bytes = 10 * 1024 * 1024
+    cache.put_decoded(url, options, img)
+    assert (cache.get_decoded(url, options) == img).all()
+    assert cache.get_decoded(url, {"half_size": False, "quality": 3}) is None
+
+    ValidatingHandler.files["/b.dng"] = b"B" * 50000
+    downloader.download(url, tmp_path)
+    assert cache.get_decoded(url, options) is None
+
+
+def test_locks_are_per_url(tmp_path, server):
+    cache = RawCache(tmp_path / "cache", quota_mb=0.07)
+    # Two URLs whose keys share a prefix must not wait on each other
+    first, prefix = "/a.dng", RawCache.key("/a.dng")[:2]
+    second = next(f"/{i}.dng" for i in range(100000) if RawCache.key(f"/{i}.dng")[:2] == prefix)
+    acquired = threading.Event()
+
+    def lock_second():
+        with cache.lock(second):
+            acquired.set()
+
+    with cache.lock(first):
+        threading.Thread(target=lock_second).start()
+        assert acquired.wait(2)
+
+    # Lock files do not outlive their entries
+    downloader = RawDownloader(1, cache=cache)
+    downloader.download(f"{server}/plain.dng", tmp_path)
+    downloader.download(f"{server}/a.dng", tmp_path)
+    downloader.download(f"{server}/b.dng", tmp_path)
+    locks = tmp_path / "cache" / "locks"
+    assert [p.name for p in locks.iterdir()] == [f"{RawCache.key(f'{server}/b.dng')}.lock"]
+
+
+def test_bracket_survives_eviction_after_store(tmp_path, server):
+    class RacingCache(RawCache):
+        """Another worker evicts the entry, or the meta write fails, right after it is stored"""
+
+        fail = False
+
+        def store(self, url, tmp_path, headers):
+            path = super().store(url, tmp_path, headers)
+            path.unlink()
+            if self.fail:
+                raise OSError("disk full")
+            return path
+
+    cache = RacingCache(tmp_path / "cache", quota_mb=10)
+    downloader = RawDownloader(1, cache=cache)
+    assert downloader.download(f"{server}/a.dng", tmp_path).read_bytes() == b"a" * 50000
+    cache.fail = True
+    assert downloader.download(f"{server}/b.dng", tmp_path).read_bytes() == b"b" * 50000
+    assert not [p for p in (tmp_path / "cache").iterdir() if p.name.endswith(".tmp")]
+
+
+def test_evicted_entries_take_their_decoded_arrays(tmp_path, server):
+    cache = RawCache(tmp_path / "cache", quota_mb=10, keep_decoded=True)
+    downloader = RawDownloader(1, cache=cache)
+    url = f"{server}/a.dng"
+    options = {"half_size": True, "quality": 3}
+    downloader.download(url, tmp_path)
+    cache.put_decoded(url, options, np.zeros((2, 2, 3), dtype=np.uint16))
+
+    cache.quota_bytes = 70 * 1024
+    downloader.download(f"{server}/b.dng", tmp_path)
+    assert cache.lookup(url) is None
+    assert not list((tmp_path / "cache").glob(f"{RawCache.key(url)}.*.npy"))
+
+
+def test_staging_dir_hard_links_cached_files(tmp_path, server):
+    cache = RawCache(tmp_path / "cache", quota_mb=10)
+    downloader = RawDownloader(1, cache=cache)
+    staging = cache.staging_dir()
+    url = f"{server}/a.dng"
+    for path in (downloader.download(url, staging), downloader.download(url, staging)):
+        assert path.stat().st_ino == cache.path_for(url).stat().st_ino
+    assert cache.stats["hits"] == 1
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests for raw decoding helpers
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+from PIL.TiffImagePlugin import ImageFileDirectory_v2
+
+from raw_decode import EXPOSURE_TIME_TAG, decode_raw, optimize_bracket, read_exposure_time
+
+
+def test_optimize_bracket_fits_and_converts_to_8bit():
+    img = np.full((3000, 6000, 3), 65535, dtype=np.uint16)
+    out = optimize_bracket(img, max_size=4096)
+    assert out.shape == (2048, 4096, 3)
+    assert out.dtype == np.uint8
+    assert out.max() == 255
+
+    small = np.full((100, 200, 3), 257 * 10, dtype=np.uint16)
+    out = optimize_bracket(small, max_size=4096)
+    assert out.shape == small.shape
+    assert (out == 10).all()
+
+
+def test_decode_raw_errors(tmp_path):
+    path = tmp_path / "not_raw.dng"
+    path.write_bytes(b"not a raw file")
+    for quality in (7, True, 3.0):
+        with pytest.raises(ValueError):
+            decode_raw(path, quality=quality)
+    with pytest.raises(RuntimeError):
+        decode_raw(path)
+
+
+def test_read_exposure_time(tmp_path):
+    info = ImageFileDirectory_v2()
+    info[EXPOSURE_TIME_TAG] = 0.004
+    info.tagtype[EXPOSURE_TIME_TAG] = 5  # RATIONAL
+    path = tmp_path / "bracket.dng"
+    Image.new("RGB", (4, 4)).save(path, format="TIFF", tiffinfo=info)
+    assert read_exposure_time(path) == pytest.approx(0.004)
+
+    path.write_bytes(b"not a raw file")
+    assert read_exposure_time(path) is None
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Tests for concurrent bracket downloads against a local HTTP server
+"""
+
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from raw_downloads import RawDownloader
+
+FILES = {f"/bracket{i}.dng": bytes([i]) * (300 * 1024) for i in range(5)}
+
+
+class RawFileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.2
+    connections = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.connections.add(self.client_address)
+        body = FILES.get(self.path.split("?")[0])
+        if body is None:
+            self.send_error(404)
+            return
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    RawFileHandler.connections = set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RawFileHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_downloads_run_concurrently(tmp_path, server):
+    downloader = RawDownloader(max_size_mb=1, workers=5, chunk_kb=64)
+    urls = [server + name for name in FILES]
+    start = time.perf_counter()
+    paths = downloader.download_all(urls, tmp_path)
+    elapsed = time.perf_counter() - start
+
+    assert [p.read_bytes() for p in paths] == list(FILES.values())
+    assert elapsed < 5 * RawFileHandler.delay
+
+    # A second batch reuses the pooled keep-alive connections
+    downloader.download_all(urls, tmp_path)
+    assert len(RawFileHandler.connections) <= 5
+
+
+def test_size_limit_and_errors(tmp_path, server):
+    downloader = RawDownloader(max_size_mb=0.25, workers=2)
+    with pytest.raises(ValueError):
+        downloader.download(server + "/bracket0.dng", tmp_path)
+    with pytest.raises(RuntimeError):
+        RawDownloader(max_size_mb=1).download(server + "/missing.dng", tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves BODY with byte ranges; truncates the first response of each range in `flaky`"""
+
+    protocol_version = "HTTP/1.1"
+    body = bytes(range(256)) * 4096  # 1 MiB
+    ranges = []
+    flaky = set()
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d+)?", self.headers.get("Range", ""))
+        if match is None:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(self.body)))
+            self.end_headers()
+            self.wfile.write(self.body)
+            return
+
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(self.body) - 1), len(self.body) - 1)
+        with self.lock:
+            self.ranges.append((start, end))
+            truncate = start in self.flaky
+            self.flaky.discard(start)
+        part = self.body[start:end + 1]
+        self.send_response(206)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.body)}")
+        self.send_header("Content-Length", str(len(part)))
+        self.end_headers()
+        if truncate:
+            self.wfile.write(part[:len(part) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        time.sleep(0.05)
+        self.wfile.write(part)
+
+
+@pytest.fixture
+def range_server():
+    RangeHandler.ranges = []
+    RangeHandler.flaky = set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_ranged_download_resumes_failed_segments(tmp_path, range_server):
+    segment = 128 * 1024
+    RangeHandler.flaky = {3 * segment}
+    downloader = RawDownloader(max_size_mb=2, segment_mb=0.125, segment_workers=4, chunk_kb=16)
+    path = downloader.download(range_server + "/big.dng", tmp_path)
+
+    assert path.read_bytes() == RangeHandler.body
+    starts = sorted(start for start, _ in RangeHandler.ranges)
+    # 8 segments, plus one resume of the truncated segment from where it stopped
+    assert len(starts) == 9
+    resumed = [start for start in starts if start % segment]
+    assert len(resumed) == 1 and 3 * segment < resumed[0] < 4 * segment
+
+
+def test_ranged_download_limits(tmp_path, range_server):
+    with pytest.raises(ValueError):
+        RawDownloader(max_size_mb=0.5, segment_mb=0.125).download(range_server + "/big.dng", tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+    # Without ranges the file is streamed in a single request
+    RangeHandler.ranges = []
+    path = RawDownloader(max_size_mb=2, segment_mb=0).download(range_server + "/big.dng", tmp_path)
+    assert path.read_bytes() == RangeHandler.body
+    assert RangeHandler.ranges == []
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed result cache
+"""
+
+import os
+import time
+
+from result_cache import ResultCache, result_key
+
+
+def test_key_depends_on_bytes_and_params():
+    key = result_key(b"image", {"camera": "generic", "fovd": None})
+    assert key == result_key(b"image", {"fovd": None, "camera": "generic"})
+    assert key != result_key(b"image2", {"camera": "generic", "fovd": None})
+    assert key != result_key(b"image", {"camera": "generic", "fovd": 200.0})
+
+
+def test_hit_miss_and_lru_eviction(tmp_path):
+    cache = ResultCache(cache_dir=tmp_path / "results", quota_mb=1)
+    assert cache.get("a") is None
+
+    src = tmp_path / "result.jpg"
+    src.write_bytes(b"x" * 400 * 1024)
+    for age, key in ((30, "a"), (20, "b")):
+        os.utime(cache.put(key, src), (time.time() - age,) * 2)
+    assert cache.get("a").read_bytes() == src.read_bytes()  # "a" is now most recent
+
+    cache.put_bytes("c", src.read_bytes())
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats == {"hits": 3, "misses": 2, "stores": 3, "evictions": 1}
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight request coalescing
+"""
+
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_duplicates_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "pano"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", compute)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", compute)))
+                 for _ in range(4)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("pano", False)] + [("pano", True)] * 4
+    assert flight.stats == {"leaders": 1, "followers": 4}
+    assert flight.in_flight() == 0
+
+    # Once finished, the next call computes again
+    assert flight.do("k", compute) == ("pano", False)
+    assert len(calls) == 2
+
+
+def test_errors_propagate_to_followers():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait()
+        raise RuntimeError("stitch failed")
+
+    errors = []
+
+    def run():
+        try:
+            flight.do("k", fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=run)]
+    threads[0].start()
+    started.wait()
+    threads.append(threading.Thread(target=run))
+    threads[1].start()
+    while flight.stats["followers"] == 0:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert errors == ["stitch failed", "stitch failed"]
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: int("x"))
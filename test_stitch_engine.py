@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-process fisheye stitch engine
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+import mls_cache
+from stitch_engine import FisheyeStitcher, MAX_FOVD
+
+TEST_IMAGE_PATH = Path(__file__).parent / "input" / "image.jpg"
+
+
+def write_identity_mls_map(path, width, height):
+    """Write an identity MLS grid sized for a width x height dual-fisheye frame."""
+    ws = width // 2
+    hd = int(ws * 360.0 / MAX_FOVD) // 2
+    map_x, map_y = np.meshgrid(np.arange(ws, dtype=np.float32),
+                               np.arange(hd - 2, dtype=np.float32))
+    fs = cv2.FileStorage(str(path), cv2.FILE_STORAGE_WRITE)
+    fs.write("Xd", map_x)
+    fs.write("Yd", map_y)
+    fs.release()
+    return path
+
+
+@pytest.fixture(autouse=True)
+def mls_cache_dir(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "mls_cache"
+    monkeypatch.setattr(mls_cache, "MLS_CACHE_DIR", cache_dir)
+    return cache_dir
+
+
+@pytest.fixture
+def frame():
+    return cv2.imread(str(TEST_IMAGE_PATH), cv2.IMREAD_COLOR)
+
+
+@pytest.fixture
+def stitcher(tmp_path, frame):
+    h, w = frame.shape[:2]
+    map_path = write_identity_mls_map(tmp_path / "grid.yml.gz", w, h)
+    return FisheyeStitcher(w, h, map_path=map_path)
+
+
+def test_stitch_frame_shape(stitcher, frame):
+    pano = stitcher.stitch_frame(frame)
+    assert pano.dtype == np.uint8
+    assert pano.shape == (stitcher.m_hd - 2, 2 * stitcher.m_wd2, 3)
+    assert pano.mean() > 0
+
+
+def test_stitch_is_repeatable(stitcher, frame):
+    first = stitcher.stitch_frame(frame)
+    second = stitcher.stitch_frame(frame)
+    assert np.array_equal(first, second)
+
+
+def test_stitch_rejects_other_resolution(stitcher, frame):
+    with pytest.raises(ValueError):
+        stitcher.stitch_frame(cv2.resize(frame, (frame.shape[1] * 2, frame.shape[0] * 2)))
+
+
+def test_missing_mls_map(tmp_path, frame):
+    h, w = frame.shape[:2]
+    with pytest.raises(RuntimeError):
+        FisheyeStitcher(w, h, map_path=tmp_path / "missing.yml.gz")
+
+
+def test_composed_maps_match_two_pass(tmp_path, frame):
+    h, w = frame.shape[:2]
+    ws = w // 2
+    hd = int(ws * 360.0 / MAX_FOVD) // 2
+    map_x, map_y = np.meshgrid(np.arange(ws, dtype=np.float32),
+                               np.arange(hd - 2, dtype=np.float32))
+    map_path = tmp_path / "shifted.yml.gz"
+    fs = cv2.FileStorage(str(map_path), cv2.FILE_STORAGE_WRITE)
+    fs.write("Xd", map_x + 1.5)
+    fs.write("Yd", map_y - 0.75)
+    fs.release()
+    s = FisheyeStitcher(w, h, map_path=map_path)
+
+    right = cv2.bitwise_and(frame[:, ws:], s.m_cir_mask)
+    unwarped = cv2.remap(right, s.m_map_x, s.m_map_y, cv2.INTER_LINEAR)
+    x_r = s.m_wd // 2 - ws // 2
+    crop = np.ascontiguousarray(unwarped[:hd - 2, x_r:x_r + ws])
+    two_pass = cv2.remap(crop, map_x + 1.5, map_y - 0.75, cv2.INTER_LINEAR)
+    single_pass = s._remap(right, s.m_right_maps)
+
+    assert single_pass.shape == two_pass.shape
+    interior = (slice(2, -2), slice(2, -2))
+    diff = np.abs(single_pass[interior].astype(np.int16) - two_pass[interior].astype(np.int16))
+    assert diff.mean() < 2.0
+
+
+def row_loop_blend(s, left_img, right_img_aligned):
+    """Per-row ramp blending as done by FisheyeStitcher::blend() in C++."""
+    mask = s.m_binary_mask
+    H, W = mask.shape[:2]
+    worg = s.m_ws
+    im_h, im_w = left_img.shape[:2]
+    x_cr = im_w // 2 + 1 - worg // 2
+    left_cr = left_img[:, x_cr:x_cr + worg].astype(np.float64)
+    right = right_img_aligned.astype(np.float64)
+
+    side_w = s._scaled(45)
+    w = 2 * side_w
+    ramp_left = (w - np.arange(w) + 1) / w
+    ramp_right = np.arange(w) / w
+    for r in range(min(H, im_h)):
+        p = s.m_blend_post[r]
+        if p == 0:
+            continue
+        l0, r0 = p - side_w, W - p - side_w
+        bleft = ramp_left[:, None] * left_cr[r, l0:l0 + w] + (1 - ramp_left[:, None]) * right[r, l0:l0 + w]
+        bright = ramp_right[:, None] * left_cr[r, r0:r0 + w] + (1 - ramp_right[:, None]) * right[r, r0:r0 + w]
+        left_cr[r, l0:l0 + w] = right[r, l0:l0 + w] = bleft
+        left_cr[r, r0:r0 + w] = right[r, r0:r0 + w] = bright
+
+    left_cr = np.clip(np.rint(left_cr), 0, 255).astype(np.uint8)
+    right = np.clip(np.rint(right), 0, 255).astype(np.uint8)
+    mask_ = mask[:im_h]
+    pano = left_img.copy()
+    x0 = im_w // 2 - worg // 2
+    pano[:, x0:x0 + worg] = (left_cr & mask_) | (right & ~mask_)
+    return pano
+
+
+def test_vectorized_blend_matches_row_loop(stitcher, frame):
+    ws = frame.shape[1] // 2
+    left = stitcher._remap(cv2.bitwise_and(frame[:, :ws], stitcher.m_cir_mask), stitcher.m_left_maps)
+    right = stitcher._remap(cv2.bitwise_and(frame[:, ws:], stitcher.m_cir_mask), stitcher.m_right_maps)
+
+    expected = row_loop_blend(stitcher, left, right)
+    pano = stitcher._blend(left.copy(), right)
+    diff = np.abs(pano.astype(np.int16) - expected.astype(np.int16))
+    assert diff.max() <= 1
+
+
+def test_scale_map_matches_loop(stitcher):
+    W_, H_ = stitcher.m_ws2, stitcher.m_hs2
+    x_coor = np.arange(W_, dtype=np.float64)
+    r_pf = 1.0 / np.polyval([-7.5625e-17, 1.9589e-13, -1.8547e-10, 6.1997e-08, -6.9432e-05, 0.9976], x_coor)
+    quad_4 = np.zeros((H_, W_))
+    for x in range(W_):
+        for y in range(H_):
+            r = int(np.floor(np.sqrt(x * x + y * y)))
+            quad_4[y, x] = r_pf[W_ - 1] if r >= W_ - 1 else (r_pf[r] + r_pf[r + 1]) / 2.0
+
+    scale_map = stitcher.m_scale_map
+    assert scale_map.shape == (stitcher.m_hs, stitcher.m_ws, 3)
+    assert np.allclose(scale_map[H_:, W_:, 0][stitcher.m_cir_mask[H_:, W_:, 0] > 0],
+                       quad_4[stitcher.m_cir_mask[H_:, W_:, 0] > 0], rtol=1e-5)
+    assert not scale_map[stitcher.m_cir_mask == 0].any()
+
+
+def test_light_compen_brightens_edges(stitcher, frame):
+    plain = stitcher.stitch_frame(frame)
+    compensated = stitcher.stitch_frame(frame, light_compen=True)
+    assert plain.shape == compensated.shape
+    assert compensated.astype(np.float64).mean() > plain.astype(np.float64).mean()
+
+
+def test_pyramid_match_finds_full_search_peak():
+    rng = np.random.default_rng(0)
+    ref = cv2.GaussianBlur(rng.integers(0, 255, (160, 240, 3), dtype=np.uint8), (5, 5), 0)
+    tmpl = ref[40:120, 137:167].copy()
+
+    result = cv2.matchTemplate(ref, tmpl, cv2.TM_CCORR_NORMED)
+    _, _, _, expected = cv2.minMaxLoc(result)
+    loc, score = FisheyeStitcher._find_match_loc(ref, tmpl)
+    assert loc == expected == (137, 40)
+    assert score == pytest.approx(1.0, abs=1e-4)
+
+
+def test_refine_align_reuses_cached_alignment(stitcher, frame):
+    first = stitcher.stitch_frame(frame, refine_align=True, align_key="cam-1")
+    assert stitcher.m_alignment_stats == {"reused": 0, "searched": 1}
+    second = stitcher.stitch_frame(frame, refine_align=True, align_key="cam-1")
+    assert stitcher.m_alignment_stats == {"reused": 1, "searched": 1}
+    assert np.array_equal(first, second)
+
+    # A different camera gets its own alignment
+    stitcher.stitch_frame(frame, refine_align=True, align_key="cam-2")
+    assert stitcher.m_alignment_stats["searched"] == 2
+
+    # A degraded match at the cached location triggers a new search
+    stitcher.m_alignment["cam-1"]["score_left"] = 2.0
+    stitcher.stitch_frame(frame, refine_align=True, align_key="cam-1")
+    assert stitcher.m_alignment_stats["searched"] == 3
+
+
+def test_refine_align_researches_flipped_frame(stitcher, frame):
+    stitcher.stitch_frame(frame, refine_align=True, align_key="cam-1")
+    stitcher.stitch_frame(cv2.flip(frame, -1), refine_align=True, align_key="cam-1")
+    assert stitcher.m_alignment_stats == {"reused": 0, "searched": 2}
+
+
+def test_refine_align_without_key_is_not_cached(stitcher, frame):
+    stitcher.stitch_frame(frame, refine_align=True)
+    stitcher.stitch_frame(frame, refine_align=True)
+    assert stitcher.m_alignment_stats == {"reused": 0, "searched": 2}
+    assert stitcher.m_alignment == {}
+
+
+def test_alignment_cache_evicts_least_recently_used(stitcher, frame):
+    stitcher.m_alignment_slots = 2
+    stitcher.stitch_frame(frame, refine_align=True, align_key="cam-1")
+    stitcher.stitch_frame(frame, refine_align=True, align_key="cam-2")
+    stitcher.stitch_frame(frame, refine_align=True, align_key="cam-1")
+    stitcher.stitch_frame(frame, refine_align=True, align_key="cam-3")
+    assert list(stitcher.m_alignment) == ["cam-1", "cam-3"]
+    assert stitcher.alignment("cam-2") is None
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the asynchronous stitch job queue
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from stitch_jobs import QueueFull, StitchJobQueue
+
+
+def wait_for(jobs, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while jobs.status(job_id)["status"] in ("queued", "processing"):
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return jobs.status(job_id)
+
+
+def test_job_lifecycle(tmp_path):
+    jobs = StitchJobQueue(job_dir=tmp_path, workers=1, depth=2)
+    job_id = jobs.submit(lambda: b"pano")
+    assert wait_for(jobs, job_id)["status"] == "complete"
+    assert jobs.result_path(job_id).read_bytes() == b"pano"
+
+    def fail():
+        raise RuntimeError("Invalid image format")
+
+    failed = jobs.submit(fail)
+    status = wait_for(jobs, failed)
+    assert status["status"] == "error" and status["error"] == "Invalid image format"
+    assert jobs.result_path(failed) is None
+    assert jobs.status("../etc") is None
+    assert jobs.stats == {"submitted": 2, "rejected": 0, "completed": 1, "failed": 1}
+
+
+def test_full_queue_rejects(tmp_path):
+    release = threading.Event()
+    jobs = StitchJobQueue(job_dir=tmp_path, workers=1, depth=1)
+    running = jobs.submit(lambda: release.wait() and b"first")
+    while jobs.status(running)["status"] != "processing":
+        time.sleep(0.01)
+    queued = jobs.submit(lambda: b"second")
+    with pytest.raises(QueueFull):
+        jobs.submit(lambda: b"third")
+    assert jobs.stats["rejected"] == 1
+    assert len(list(tmp_path.iterdir())) == 2
+
+    release.set()
+    wait_for(jobs, running)
+    assert wait_for(jobs, queued)["status"] == "complete"
+
+
+def test_expire_keeps_unfinished_jobs(tmp_path):
+    release = threading.Event()
+    jobs = StitchJobQueue(job_dir=tmp_path, workers=1, depth=2, ttl=0)
+    done = jobs.submit(lambda: b"pano")
+    wait_for(jobs, done)
+    running = jobs.submit(lambda: release.wait() and b"slow")
+    while jobs.status(running)["status"] != "processing":
+        time.sleep(0.01)
+
+    jobs._expire()
+    assert jobs.status(done) is None
+    assert jobs.status(running)["status"] == "processing"
+    release.set()
+    assert wait_for(jobs, running)["status"] == "complete"
+
+
+def test_abandoned_jobs_fail_and_live_jobs_keep_beating(tmp_path):
+    jobs = StitchJobQueue(job_dir=tmp_path, workers=1, heartbeat=0.05, stale_after=0.3)
+    slow = jobs.submit(lambda: time.sleep(0.6) or b"slow")
+    assert wait_for(jobs, slow)["status"] == "complete"
+
+    # Left queued by a worker process that has since died
+    orphan = jobs.new_job_id()
+    (tmp_path / orphan).mkdir()
+    (tmp_path / orphan / "status.json").write_text(json.dumps(
+        {"job_id": orphan, "status": "processing", "owner": 1, "heartbeat": time.time() - 1}))
+    status = jobs.status(orphan)
+    assert status["status"] == "error" and "finished" in status
+
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    jobs = StitchJobQueue(job_dir=tmp_path)
+    job_id = jobs.new_job_id()
+    (tmp_path / job_id).mkdir()
+
+    def update(i):
+        for j in range(20):
+            jobs.update(job_id, **{f"field_{i}_{j}": j})
+
+    threads = [threading.Thread(target=update, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(jobs.status(job_id)) == 1 + 4 * 20
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for deep-zoom tile pyramids
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from tiles import build_tile_pyramid, evict_tilesets, existing_tileset, pyramid_levels
+
+
+def test_pyramid_levels_halve_down_to_one_pixel():
+    levels = pyramid_levels(np.zeros((300, 1000, 3), np.uint8))
+    assert len(levels) == 11  # ceil(log2(1000)) + 1
+    assert levels[-1].shape[:2] == (300, 1000)
+    assert levels[-2].shape[:2] == (150, 500)
+    assert levels[-3].shape[:2] == (75, 250)
+    assert levels[0].shape[:2] == (1, 1)
+
+
+def test_build_equirectangular_tiles(tmp_path):
+    rng = np.random.default_rng(0)
+    pano = rng.integers(0, 255, (300, 1000, 3), dtype=np.uint8)
+    names = build_tile_pyramid(pano, "a" * 32, tile_size=256, tile_dir=tmp_path, workers=4)
+    assert names == ["pano"]
+
+    tiles = tmp_path / ("a" * 32) / "pano_files"
+    assert 'Width="1000" Height="300"' in (tmp_path / ("a" * 32) / "pano.dzi").read_text()
+    assert sorted(p.name for p in (tiles / "10").iterdir()) == [
+        f"{col}_{row}.jpg" for col in range(4) for row in range(2)]
+    # Edge tiles carry the 1 px overlap on their inner sides only
+    assert cv2.imread(str(tiles / "10" / "0_0.jpg")).shape[:2] == (257, 257)
+    assert cv2.imread(str(tiles / "10" / "3_1.jpg")).shape[:2] == (45, 233)
+    assert list((tiles / "0").iterdir())[0].name == "0_0.jpg"
+
+    assert existing_tileset("a" * 32, tmp_path) == ["pano"]
+    assert existing_tileset("b" * 32, tmp_path) is None
+
+
+def test_cubemap_tiles_and_eviction(tmp_path):
+    pano = np.full((256, 512, 3), 128, np.uint8)
+    names = build_tile_pyramid(pano, "c" * 32, layout="cubemap", tile_dir=tmp_path)
+    assert names == ["back", "down", "front", "left", "right", "up"]
+    assert (tmp_path / ("c" * 32) / "up_files" / "7" / "0_0.jpg").exists()
+
+    build_tile_pyramid(pano, "d" * 32, tile_dir=tmp_path)
+    evict_tilesets(tmp_path, quota_mb=0, keep=tmp_path / ("d" * 32))
+    assert [p.name for p in tmp_path.iterdir()] == ["d" * 32]
+
+
+def test_eviction_skips_tileset_removed_mid_walk(tmp_path, monkeypatch):
+    pano = np.full((256, 512, 3), 128, np.uint8)
+    build_tile_pyramid(pano, "e" * 32, tile_dir=tmp_path)
+    build_tile_pyramid(pano, "f" * 32, tile_dir=tmp_path)
+    rglob = Path.rglob
+
+    def vanishing_rglob(self, pattern):
+        if self.name == "e" * 32:
+            raise FileNotFoundError(self)
+        return rglob(self, pattern)
+
+    monkeypatch.setattr(Path, "rglob", vanishing_rglob)
+    evict_tilesets(tmp_path, quota_mb=0, keep=tmp_path / ("f" * 32))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["e" * 32, "f" * 32]
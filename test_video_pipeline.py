@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the pipelined video stitcher
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+import calibration_registry
+from calibration_registry import CalibrationRegistry
+from video_pipeline import stitch_video
+
+TEST_IMAGE_PATH = Path(__file__).parent / "input" / "image.jpg"
+
+
+@pytest.fixture(autouse=True)
+def registry(tmp_path, monkeypatch):
+    registry = CalibrationRegistry(cache_dir=tmp_path / "calibration")
+    monkeypatch.setattr(calibration_registry, "registry", registry)
+    return registry
+
+
+@pytest.fixture
+def video(tmp_path):
+    frame = cv2.imread(str(TEST_IMAGE_PATH), cv2.IMREAD_COLOR)
+    path = tmp_path / "input.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, frame.shape[1::-1])
+    for i in range(12):
+        writer.write(np.roll(frame, 4 * i, axis=0))
+    writer.release()
+    return path
+
+
+def test_stitch_video_keeps_frame_order(tmp_path, video):
+    stats = stitch_video(video, tmp_path / "pano.mp4", camera="generic", stitch_threads=3,
+                         queue_frames=2)
+    assert stats["frames"] == 12
+    assert stats["fps"] > 0
+    assert set(stats["utilization"]) == {"decode", "stitch", "encode"}
+
+    cap = cv2.VideoCapture(str(video))
+    stitcher = calibration_registry.get_stitcher(720, 360, profile="generic")
+    expected = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        expected.append(stitcher.stitch_frame(frame).astype(np.float32))
+
+    out = cv2.VideoCapture(str(tmp_path / "pano.mp4"))
+    for i in range(12):
+        ok, pano = out.read()
+        assert ok
+        errors = [np.abs(pano.astype(np.float32) - e).mean() for e in expected]
+        assert int(np.argmin(errors)) == i
+
+
+def test_stitch_video_rejects_unreadable_input(tmp_path):
+    bad = tmp_path / "bad.mp4"
+    bad.write_bytes(b"not a video")
+    with pytest.raises(RuntimeError):
+        stitch_video(bad, tmp_path / "pano.mp4", camera="generic")
+
+
+def test_refine_align_checks_keyframes_only(tmp_path, video, registry):
+    stats = stitch_video(video, tmp_path / "pano.mp4", camera="generic", refine_align=True,
+                         camera_id="rig-1", stitch_threads=1, keyframe_interval=5)
+    assert stats["frames"] == 12
+    # Frame 0 has nothing cached to check, so only keyframes 5 and 10 count
+    assert stats["alignment"]["keyframes"] == 2
+    assert stats["alignment"]["searches"] <= 3
+
+    stitcher = registry.get(720, 360, profile="generic")
+    # Drift is measured on keyframes 5 and 10 only; the other frames reuse the homography
+    assert stitcher.m_alignment_stats["reused"] + stitcher.m_alignment_stats["searched"] == 12
+    assert stitcher.alignment("rig-1") is not None
+
+    # A per-video alignment is dropped when the video is done
+    stitch_video(video, tmp_path / "pano2.mp4", camera="generic", refine_align=True, stitch_threads=1)
+    assert list(stitcher.m_alignment) == ["rig-1"]
+
+
+def test_parallel_stitch_threads_search_once_at_startup(tmp_path, video, registry):
+    stats = stitch_video(video, tmp_path / "pano.mp4", camera="generic", refine_align=True,
+                         camera_id="rig-2", stitch_threads=4, keyframe_interval=100)
+    assert stats["alignment"] == {"keyframes": 0, "searches": 1, "drift": 0.0}
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tile Pyramids
+Writes Deep Zoom (DZI) tile pyramids of stitched panoramas, either of the
+equirectangular frame or of its six cube faces, so viewers fetch only the
+tiles of the current viewport and zoom level.
+
+Levels are produced in one pass by halving the in-memory panorama, and tiles
+are JPEG-encoded in parallel. Tile sets are content-addressed directories
+under TILE_DIR, capped at TILE_CACHE_QUOTA_MB with LRU eviction.
+"""
+
+import logging
+import math
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+
+from projection import cubemap
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent
+TILE_DIR = Path(os.environ.get("TILE_DIR", PROJECT_ROOT / "utils" / "cache" / "tiles"))
+TILE_CACHE_QUOTA_MB = int(os.environ.get("TILE_CACHE_QUOTA_MB", 2048))
+TILE_SIZE = 512
+TILE_OVERLAP = 1
+TILE_QUALITY = 85
+TILE_WORKERS = int(os.environ.get("TILE_WORKERS", os.cpu_count() or 4))
+
+DZI_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="jpg" Overlap="{overlap}" TileSize="{tile_size}">
+  <Size Width="{width}" Height="{height}"/>
+</Image>
+"""
+
+
+def pyramid_levels(image):
+    """Images for DZI levels 0 (1x1) .. max (full size), built by repeated halving."""
+    height, width = image.shape[:2]
+    max_level = math.ceil(math.log2(max(width, height)))
+    levels = [image]
+    for level in range(max_level - 1, -1, -1):
+        scale = 2 ** (max_level - level)
+        size = (math.ceil(width / scale), math.ceil(height / scale))
+        levels.append(cv2.resize(levels[-1], size, interpolation=cv2.INTER_AREA))
+    return levels[::-1]
+
+
+def _encode_tile(image, path, quality):
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError(f"Error encoding tile {path}")
+    path.write_bytes(encoded.tobytes())
+
+
+def write_dzi(image, out_dir, name, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+              quality=TILE_QUALITY, executor=None):
+    """Write <name>.dzi and <name>_files/<level>/<col>_<row>.jpg; returns the tile futures."""
+    height, width = image.shape[:2]
+    files_dir = out_dir / f"{name}_files"
+    futures = []
+    for level, level_image in enumerate(pyramid_levels(image)):
+        level_h, level_w = level_image.shape[:2]
+        level_dir = files_dir / str(level)
+        level_dir.mkdir(parents=True, exist_ok=True)
+        for row in range(math.ceil(level_h / tile_size)):
+            for col in range(math.ceil(level_w / tile_size)):
+                x0 = max(col * tile_size - overlap, 0)
+                y0 = max(row * tile_size - overlap, 0)
+                x1 = min((col + 1) * tile_size + overlap, level_w)
+                y1 = min((row + 1) * tile_size + overlap, level_h)
+                futures.append(executor.submit(_encode_tile, level_image[y0:y1, x0:x1],
+                                               level_dir / f"{col}_{row}.jpg", quality))
+    (out_dir / f"{name}.dzi").write_text(DZI_TEMPLATE.format(
+        overlap=overlap, tile_size=tile_size, width=width, height=height))
+    return futures
+
+
+def existing_tileset(tileset, tile_dir=None):
+    """DZI image names of a complete tile set, or None if it has not been built."""
+    out_dir = Path(tile_dir or TILE_DIR) / tileset
+    try:
+        if not (out_dir / "complete").exists():
+            return None
+        os.utime(out_dir)  # LRU bookkeeping
+    except OSError:
+        return None
+    return sorted(path.stem for path in out_dir.glob("*.dzi"))
+
+
+def build_tile_pyramid(pano, tileset, layout="equirectangular", tile_size=TILE_SIZE,
+                       tile_dir=None, workers=None):
+    """
+    Write the tile pyramid of a panorama as tile set `tileset` (reused if it
+    already exists). Returns the names of the DZI images in the set.
+    """
+    tile_dir = Path(tile_dir or TILE_DIR)
+    out_dir = tile_dir / tileset
+    names = existing_tileset(tileset, tile_dir)
+    if names is not None:
+        return names
+
+    if layout == "cubemap":
+        images = cubemap(pano)
+    elif layout == "equirectangular":
+        images = {"pano": pano}
+    else:
+        raise ValueError(f"Unknown tile layout: {layout}")
+
+    tile_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir = tile_dir / f".{tileset}.{os.getpid()}.{threading.get_ident()}.tmp"
+    tmp_dir.mkdir()
+    try:
+        with ThreadPoolExecutor(max_workers=workers or TILE_WORKERS) as executor:
+            futures = []
+            for name, image in images.items():
+                futures += write_dzi(image, tmp_dir, name, tile_size=tile_size, executor=executor)
+            for future in futures:
+                future.result()
+        (tmp_dir / "complete").touch()
+        try:
+            os.rename(tmp_dir, out_dir)
+        except OSError:
+            pass  # another worker built the same tile set first
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    logger.info(f"Wrote {layout} tile pyramid {tileset} ({len(futures)} tiles)")
+    evict_tilesets(tile_dir, keep=out_dir)
+    return sorted(images)
+
+
+def evict_tilesets(tile_dir=None, quota_mb=None, keep=None):
+    """Remove least recently used tile sets until the tile cache fits its quota."""
+    tile_dir = Path(tile_dir or TILE_DIR)
+    quota_bytes = (quota_mb if quota_mb is not None else TILE_CACHE_QUOTA_MB) * 1024 * 1024
+    entries = []
+    total = 0
+    for path in tile_dir.iterdir():
+        if not path.is_dir() or path.name.startswith("."):
+            continue
+        try:
+            size = sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+            entries.append((path.stat().st_mtime, size, path))
+        except OSError:
+            continue  # removed by another worker meanwhile
+        total += size
+
+    for _, size, path in sorted(entries):
+        if total <= quota_bytes:
+            break
+        if path == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logger.info(f"Evicted tile set {path.name}")
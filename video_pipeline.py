@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Video Pipeline
+Stitches dual-fisheye videos with decode, stitch and encode running as
+overlapping stages on separate threads, connected by bounded frame queues.
+
+Stitch threads may finish frames out of order; the encoder writes them back in
+sequence. Throughput (fps) and per-stage utilization are reported through the
+progress callback and returned when the video is done.
+
+With refine_align, the seam alignment is checked only on keyframes: frames in
+between reuse the cached homography as is, and a keyframe re-aligns only when
+the match-score drift at the cached locations crosses the engine's tolerance.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+import cv2
+
+from calibration_registry import DEFAULT_PROFILE, fit_frame, get_stitcher
+
+logger = logging.getLogger(__name__)
+
+VIDEO_QUEUE_FRAMES = int(os.environ.get("VIDEO_QUEUE_FRAMES", 8))
+VIDEO_STITCH_THREADS = int(os.environ.get("VIDEO_STITCH_THREADS", 2))
+VIDEO_FOURCCS = ("avc1", "mp4v")  # H.264 when the OpenCV build has an encoder
+VIDEO_KEYFRAME_INTERVAL = int(os.environ.get("VIDEO_KEYFRAME_INTERVAL", 30))  # frames between drift checks
+VIDEO_PROGRESS_EVERY = 30  # frames
+
+_DONE = object()
+
+
+def open_video_writer(path, fps, size):
+    """Open a VideoWriter with the first available codec."""
+    for code in VIDEO_FOURCCS:
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*code), fps, size)
+        if writer.isOpened():
+            return writer
+        writer.release()
+    raise RuntimeError(f"Error opening video writer: {path}")
+
+
+class VideoStitchPipeline:
+    """Decode -> stitch -> encode pipeline for one video"""
+
+    def __init__(self, fovd=None, camera=DEFAULT_PROFILE, light_compen=False, refine_align=False,
+                 camera_id=None, scale=1, queue_frames=None, stitch_threads=None,
+                 keyframe_interval=None, progress=None):
+        self.fovd = fovd
+        self.camera = camera
+        self.light_compen = light_compen
+        self.refine_align = refine_align
+        self.scale = scale
+        # Alignment is shared per camera, or kept private to this video
+        self.align_key = camera_id or f"video-{uuid.uuid4().hex}"
+        self.shared_alignment = camera_id is not None
+        self.keyframe_interval = keyframe_interval or VIDEO_KEYFRAME_INTERVAL
+        self.queue_frames = queue_frames or VIDEO_QUEUE_FRAMES
+        self.stitch_threads = stitch_threads or VIDEO_STITCH_THREADS
+        self.progress = progress
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._errors = []
+        self._busy = {"decode": 0.0, "stitch": 0.0, "encode": 0.0}
+        self._stitcher = None
+        self._first_aligned = threading.Event()
+        self._keyframes = 0
+
+    def _put(self, q, item):
+        """Blocking put that gives up once the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """Blocking get that returns _DONE once the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, e):
+        with self._lock:
+            self._errors.append(e)
+        self._stop.set()
+
+    def _add_busy(self, stage, seconds):
+        with self._lock:
+            self._busy[stage] += seconds
+
+    def _decode(self, cap, decoded):
+        try:
+            index = 0
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                frame = fit_frame(frame, self.scale)
+                self._add_busy("decode", time.perf_counter() - start)
+                if not self._put(decoded, (index, frame)):
+                    return
+                index += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.stitch_threads):
+                self._put(decoded, _DONE)
+
+    def _wait_first_aligned(self):
+        """Block until frame 0 has been aligned; False once the pipeline is stopping."""
+        while not self._first_aligned.wait(timeout=0.1):
+            if self._stop.is_set():
+                return False
+        return True
+
+    def _stitch(self, decoded, stitched, remaining):
+        try:
+            while True:
+                item = self._get(decoded)
+                if item is _DONE:
+                    break
+                index, frame = item
+                # Frame 0 fills the alignment cache before any other frame is
+                # stitched, so the threads do not each run a startup search
+                if self.refine_align and index > 0 and not self._wait_first_aligned():
+                    return
+                start = time.perf_counter()
+                height, width = frame.shape[:2]
+                stitcher = get_stitcher(width, height, self.fovd, self.camera)
+                self._stitcher = stitcher
+                check_drift = index % self.keyframe_interval == 0
+                if self.refine_align and check_drift and stitcher.alignment(self.align_key) is not None:
+                    with self._lock:
+                        self._keyframes += 1
+                pano = stitcher.stitch_frame(
+                    frame, light_compen=self.light_compen, refine_align=self.refine_align,
+                    align_key=self.align_key, check_drift=check_drift)
+                if index == 0:
+                    self._first_aligned.set()
+                self._add_busy("stitch", time.perf_counter() - start)
+                if not self._put(stitched, (index, pano)):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # The last stitch thread to finish closes the encoder queue
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._put(stitched, _DONE)
+
+    def _stats(self, frames, started):
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        with self._lock:
+            busy = dict(self._busy)
+            keyframes = self._keyframes
+        stats = {
+            "frames": frames,
+            "seconds": round(elapsed, 3),
+            "fps": round(frames / elapsed, 2),
+            "utilization": {
+                "decode": round(busy["decode"] / elapsed, 3),
+                "stitch": round(busy["stitch"] / (elapsed * self.stitch_threads), 3),
+                "encode": round(busy["encode"] / elapsed, 3),
+            },
+        }
+        alignment = self._stitcher.alignment(self.align_key) if self.refine_align and self._stitcher else None
+        if alignment:
+            stats["alignment"] = {
+                "keyframes": keyframes,
+                "searches": alignment["searches"],
+                "drift": round(alignment["drift"], 4),
+            }
+        return stats
+
+    def run(self, input_path, output_path):
+        """Stitch input_path into output_path; returns throughput and utilization stats."""
+        cap = cv2.VideoCapture(str(input_path))
+        if not cap.isOpened():
+            raise RuntimeError(f"Error opening video: {input_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+        decoded = queue.Queue(maxsize=self.queue_frames)
+        stitched = queue.Queue(maxsize=self.queue_frames)
+        remaining = [self.stitch_threads]
+        threads = [threading.Thread(target=self._decode, args=(cap, decoded), name="video-decode")]
+        threads += [threading.Thread(target=self._stitch, args=(decoded, stitched, remaining),
+                                     name=f"video-stitch-{i}") for i in range(self.stitch_threads)]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        # Encode in this thread, restoring frame order
+        writer = None
+        pending = {}
+        frames = 0
+        try:
+            while True:
+                item = self._get(stitched)
+                if item is _DONE:
+                    break
+                index, pano = item
+                pending[index] = pano
+                while frames in pending:
+                    pano = pending.pop(frames)
+                    start = time.perf_counter()
+                    if writer is None:
+                        writer = open_video_writer(output_path, fps, (pano.shape[1], pano.shape[0]))
+                    writer.write(pano)
+                    self._add_busy("encode", time.perf_counter() - start)
+                    frames += 1
+                    if self.progress and frames % VIDEO_PROGRESS_EVERY == 0:
+                        self.progress(**self._stats(frames, started))
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            cap.release()
+            if writer is not None:
+                writer.release()
+
+        stats = self._stats(frames, started)
+        if self._stitcher is not None and not self.shared_alignment:
+            self._stitcher.forget_alignment(self.align_key)
+
+        if self._errors:
+            raise self._errors[0]
+        if frames == 0:
+            raise RuntimeError(f"No frames decoded from video: {input_path}")
+
+        logger.info(f"Stitched {frames} frames -> {output_path} at {stats['fps']} fps "
+                    f"(utilization {stats['utilization']})")
+        return stats
+
+
+def stitch_video(input_path, output_path, **options):
+    """Stitch a dual-fisheye video; returns throughput and stage utilization stats."""
+    return VideoStitchPipeline(**options).run(input_path, output_path)